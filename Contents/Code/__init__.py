@@ -27,10 +27,17 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 from urllib import urlencode
-from time import time
+from time import time, sleep
 from updater import Updater
+from transport import Transport, TransportError, RetryPolicy, \
+    CircuitBreaker, CircuitOpenError
+from apicache import SingleFlight, ResponseCache, LRUCache
 from datetime import datetime, timedelta
-from threading import Thread, Lock
+from threading import Thread, Lock, BoundedSemaphore
+from Queue import Queue, Empty
+import heapq
+import httplib
+import socket
 
 Video = SharedCodeService.video
 
@@ -73,12 +80,123 @@ YT_EDITABLE = {
     'favorites': L('Add to favorites'),
 }
 
+# How long API responses are used without revalidating them, by method
+YT_CACHE_TIMES = {
+    'videoCategories': CACHE_1WEEK,
+    'guideCategories': CACHE_1WEEK,
+    'channels': CACHE_1DAY,
+    'playlists': CACHE_1HOUR,
+    'playlistItems': CACHE_1MINUTE * 15,
+    'subscriptions': CACHE_1MINUTE * 5,
+    'search': CACHE_1HOUR,
+    'videos': CACHE_1HOUR,
+}
+
+# Partial responses: only the parts of a video resource anything here reads
+YT_VIDEO_FIELDS = (
+    'nextPageToken,items(id,snippet(title,description,localized,channelId,'
+    'channelTitle,publishedAt,thumbnails/high,liveBroadcastContent),'
+    'contentDetails/duration)'
+)
+
+# Quota units charged per request; reads cost 1 unless listed here
+YT_QUOTA_COSTS = {
+    'search': 100,
+}
+YT_QUOTA_WRITE_COST = 50
+
+# Share of the daily quota that background work leaves for browsing
+YT_QUOTA_INTERACTIVE_RESERVE = 0.2
+
+# Access tokens are refreshed in the background this long before they expire
+YT_TOKEN_REFRESH_MARGIN_SECONDS = 300
+
 YT_MIN_REFRESH_INTERVAL_SECONDS = 300
 
+# Bounds for how often a single channel is polled for new uploads
+YT_MIN_POLL_INTERVAL_SECONDS = 1800
+YT_MAX_POLL_INTERVAL_SECONDS = 86400
+
+YT_SUBSCRIPTIONS_REFRESH_INTERVAL_SECONDS = 3600
+
+# Clients only show the start of a summary, so the feed keeps no more than
+# this much of each description
+YT_FEED_DESCRIPTION_LENGTH = 300
+YT_SCHEDULER_TICK_SECONDS = 60
+
+# How long to trust which of a channel's related playlists can be shown
+YT_CHANNEL_INFO_CACHE_TIME = CACHE_1HOUR
+
+# Next pages being downloaded in the background at any one time
+YT_PREFETCH_CONCURRENCY = 2
+
+# Description links whose pages are downloaded at the same time
+YT_LINK_RESOLVE_CONCURRENCY = 4
+
+# Video thumbnails are available pre-scaled; 320x180, 480x360 and 640x480
+YT_THUMB_VARIANTS = {
+    'Small': 'mqdefault',
+    'Medium': 'hqdefault',
+    'Large': 'sddefault',
+}
+YT_THUMB_CACHE_SIZE = 1000
+YT_THUMB_CACHE_TIME = CACHE_1WEEK
+
+RE_VIDEO_THUMB = Regex('^(https?://i[0-9]*\.ytimg\.com/vi/[^/]+/)[a-z]*default\.jpg$')
+
+# Only images from YouTube's own hosts are downloaded and cached
+RE_THUMB_HOST = Regex('^https?://(?:i[0-9]*\.ytimg\.com|yt[0-9]*\.ggpht\.com)/')
+
 ###############################################################################
 # Init
 ###############################################################################
 
+# Shared by every request to the API and OAuth endpoints, so that the
+# connections to them are kept alive
+api_transport = Transport()
+
+# Parsed responses to API reads, as {'data', 'etag', 'expires'};
+# api_transport doesn't go through the framework HTTP cache
+api_cache = ResponseCache('api_cache')
+
+# Items of the videos method as (hl, id): (expires, item), so a video is
+# only downloaded once whichever listing it appears in
+api_video_cache = LRUCache(2000)
+
+# Results of ApiGetChannelInfo as uid: (expires, info), to save probing the
+# related playlists every time a channel is opened
+api_channel_info = LRUCache(100)
+
+# Browsing would rather fail than keep the user waiting, while background
+# work can afford to be patient
+api_retry = RetryPolicy(attempts=2, cap=4)
+api_retry_background = RetryPolicy(attempts=5, cap=60)
+
+# Fails requests straight away while the API is unhealthy
+api_circuit = CircuitBreaker()
+
+# Only one token refresh may happen at a time
+token_mutex = Lock()
+token_refresh_thread = None
+
+# Guards the quota ledger in Dict['quota']
+quota_mutex = Lock()
+
+# Identical reads that are in progress at the same time, e.g. several
+# clients opening the same screen, share one request and its result
+api_reads_in_flight = SingleFlight()
+
+# Bounds the next page prefetches; any over the limit are skipped
+prefetch_slots = BoundedSemaphore(YT_PREFETCH_CONCURRENCY)
+
+# Thumbnail images as {'data', 'type', 'expires'}, keyed by the URL
+# they were downloaded from
+thumb_cache = ResponseCache(
+    'thumb_cache',
+    memory_size=50,
+    disk_size=YT_THUMB_CACHE_SIZE
+)
+
 Plugin.AddViewGroup(
     'details',
     viewMode='InfoList',
@@ -90,9 +208,12 @@ Plugin.AddViewGroup(
 def Start():
     HTTP.CacheTime = CACHE_1HOUR
     ValidatePrefs()
+    StartSubscriptionFeedScheduler()
 
 
 def ValidatePrefs():
+    api_transport.pool_size = int(Prefs['api_pool_size'])
+
     loc = GetLanguage()
     if Core.storage.file_exists(Core.storage.abs_path(
         Core.storage.join_path(
@@ -177,6 +298,9 @@ def MainMenu(complete=False, offline=False):
     return AddSubscriptions(oc, uid='me')
 
 subscription_feed_thread = None
+subscription_feed_thread_mutex = Lock()
+subscription_feed_scheduler = None
+
 # Guard against concurrent accesses to Data store; you'd hope this is
 # already thread safe, but locking it can't hurt
 subscription_feed_mutex = Lock()
@@ -185,26 +309,31 @@ subscription_feed_mutex = Lock()
 # unlikely to actually matter in the real world
 subscription_feed_update_progress = 0
 
-def UpdateSubscriptionFeedWorker(duration = timedelta(weeks = 1)):
-    global subscription_feed_mutex
-    global subscription_feed_update_progress
+# While an update is in progress this is the feed as it currently stands,
+# with channels merged in as they complete; guarded by subscription_feed_mutex
+subscription_feed_live = None
 
-    if not CheckToken():
-        return
+# The feed as last loaded from or saved to the Data store, so paging through
+# it doesn't load it again each time; guarded by subscription_feed_mutex
+subscription_feed_saved = None
 
+def GetSubscribedChannelIds():
     channelIds = []
     offset = None
-    subscription_feed_update_progress = 0
 
     while True:
         res = ApiRequest('subscriptions', ApiGetParams(
             uid='me',
             limit='50', # Max allowed by API
-            offset=offset
-        ))
+            offset=offset,
+            fields='nextPageToken,items(snippet/resourceId/channelId)'
+        ), background=True)
 
-        if not res:
-            break
+        if res is None:
+            # Don't mistake a failure for having no subscriptions, or the
+            # whole feed would be expired
+            Log.Error('Could not get subscriptions')
+            return None
 
         if 'items' not in res:
             break
@@ -222,93 +351,521 @@ def UpdateSubscriptionFeedWorker(duration = timedelta(weeks = 1)):
         if offset is None:
             break
 
-    now = datetime.utcnow()
-    now = now.replace(hour = 0, minute = 0, second = 0, microsecond = 0)
-    cutoff = now - duration
-    rfc3339Cutoff = cutoff.isoformat('T') + 'Z'
+    return channelIds
+
+def GetChannelFeedVideos(channelId, publishedAfter):
+    videos = []
+    offset = None
+
+    while True:
+        # Always revalidate, since the whole point is to find new videos;
+        # if there aren't any the API just answers 304
+        res = ApiRequest('search', ApiGetParams(
+            channelId=channelId,
+            type='video',
+            order='date',
+            limit='50', # Max allowed by API
+            publishedAfter=publishedAfter,
+            offset=offset,
+            fields='nextPageToken,items(id/videoId,snippet/publishedAt)'
+        ), timeout=int(Prefs['feed_request_timeout']), cacheTime=0,
+        background=True)
+
+        if res is None:
+            # Let the caller know the channel failed, rather than
+            # pretending it has no videos
+            Log.Error('Could not get videos for channel %s' % channelId)
+            return None
+
+        if 'items' not in res:
+            break
+
+        offset = None
+
+        for item in res['items']:
+            videoId = item['id']['videoId']
+            date = item['snippet']['publishedAt']
+            videos.append((videoId, date))
+
+        if 'nextPageToken' in res:
+            offset = res['nextPageToken']
+
+        if offset is None:
+            break
+
+    return videos
+
+def GetUploadsPlaylistIds(channelIds):
+    # The uploads playlist of a channel never changes, so only resolve the
+    # channels we haven't seen before
+    playlistIds = Dict['uploads_playlists'] if 'uploads_playlists' in Dict else {}
+    missing = [c for c in channelIds if c not in playlistIds]
+
+    for i in xrange(0, len(missing), 50): # Max allowed by API
+        res = ApiRequest('channels', ApiGetParams(
+            part='contentDetails',
+            id=','.join(missing[i:i + 50]),
+            limit='50',
+            fields='items(id,contentDetails/relatedPlaylists/uploads)'
+        ), background=True)
+
+        if not res or 'items' not in res:
+            continue
+
+        for item in res['items']:
+            try:
+                playlistIds[item['id']] = \
+                    item['contentDetails']['relatedPlaylists']['uploads']
+            except KeyError:
+                pass
+
+    Dict['uploads_playlists'] = playlistIds
+    return playlistIds
+
+def GetUploadsFeedVideos(channelId, playlistId, publishedAfter):
+    if playlistId is None:
+        Log.Error('No uploads playlist for channel %s' % channelId)
+        return None
 
     videos = []
-    channelsUpdated = 0
-    # FIXME: this could potentially be sped up by threading the requests,
-    # or some kind of async http shenanigans
-    # You could also potentially avoid re-requesting videos that have
-    # been saved in the Data store, but that's only really going to help
-    # if the subscribed channels publish more than 50 videos per the
-    # requested duration, and that seems pretty unlikely
-    for channelId in channelIds:
+    offset = None
+
+    while True:
+        # Always revalidate, as for search
+        res = ApiRequest('playlistItems', ApiGetParams(
+            part='contentDetails',
+            playlistId=playlistId,
+            limit='50', # Max allowed by API
+            offset=offset,
+            fields='nextPageToken,items(contentDetails(videoId,videoPublishedAt))'
+        ), timeout=int(Prefs['feed_request_timeout']), cacheTime=0,
+        background=True)
+
+        if res is None:
+            Log.Error('Could not get videos for channel %s' % channelId)
+            return None
+
+        if 'items' not in res:
+            break
+
         offset = None
 
-        while True:
-            res = ApiRequest('search', ApiGetParams(
-                channelId=channelId,
-                type='video',
-                order='date',
-                limit='50', # Max allowed by API
-                publishedAfter=rfc3339Cutoff,
-                offset=offset
-            ))
+        for item in res['items']:
+            details = item['contentDetails']
 
-            if not res:
-                break
+            # Private and deleted videos have no publish date
+            if 'videoPublishedAt' not in details:
+                continue
 
-            if 'items' not in res:
-                break
+            date = details['videoPublishedAt']
 
-            offset = None
+            # Uploads are listed newest first, so everything from here on
+            # has already been seen and there's no point paging further
+            if date < publishedAfter:
+                return videos
 
-            for item in res['items']:
-                videoId = item['id']['videoId']
-                date = item['snippet']['publishedAt']
-                videos.append((videoId, date))
+            videos.append((details['videoId'], date))
+
+        if 'nextPageToken' in res:
+            offset = res['nextPageToken']
+
+        if offset is None:
+            break
+
+    return videos
+
+def LoadSubscriptionFeed():
+    # Callers are expected to hold subscription_feed_mutex
+    feed = None
+    if Data.Exists('subscription_feed'):
+        feed = Data.LoadObject('subscription_feed')
+
+    # Older versions stored a bare list of video ids, which doesn't carry
+    # enough information to update incrementally; start from scratch
+    if not isinstance(feed, dict):
+        feed = {
+            # Newest first, as {'id', 'channelId', 'publishedAt'} plus the
+            # fields of VideoRecordFromItem once the details are known
+            'videos': [],
+            # Per channel state; 'newest' is the newest publishedAt seen,
+            # 'checked' when it was last polled successfully and 'interval'
+            # how long to wait before polling it again
+            'channels': {},
+        }
+
+    return feed
+
+def ExpireFeedVideos(videos, rfc3339Cutoff, channelIds):
+    # Drop anything that has fallen out of the window, or belongs to a
+    # channel that is no longer subscribed to
+    channelIds = set(channelIds)
+
+    return [
+        video for video in videos
+        if video['publishedAt'] >= rfc3339Cutoff and \
+            video['channelId'] in channelIds
+    ]
+
+def MergeSortedVideos(lists):
+    # k-way merge of lists that are each sorted newest first; heapq.merge
+    # only goes smallest first, so merge the reversed lists and flip it
+    merged = [
+        video for (date, i, j, video) in heapq.merge(*[
+            [
+                (video['publishedAt'], i, j, video)
+                for j, video in enumerate(reversed(videos))
+            ] for i, videos in enumerate(lists)
+        ])
+    ]
+    merged.reverse()
+
+    seen = set()
+    ret = []
+    for video in merged:
+        if video['id'] not in seen:
+            seen.add(video['id'])
+            ret.append(video)
+
+    return ret
+
+def FillFeedVideoRecords(videos):
+    # Live state changes over time, so anything that isn't a plain video
+    # is looked up again along with videos we have no details for yet
+    ids = [
+        video['id'] for video in videos
+        if 'title' not in video or video['live'] != 'none'
+    ]
+    records = {}
+    failedIds = set()
+
+    for i in xrange(0, len(ids), 50): # Max allowed by API
+        res = ApiGetVideos(ids=ids[i:i + 50], background=True)
+
+        if not res or 'items' not in res:
+            failedIds.update(ids[i:i + 50])
+            continue
+
+        for item in res['items']:
+            records[item['id']] = FeedVideoRecord(item)
+
+    ret = []
+    for video in videos:
+        if video['id'] in records:
+            ret.append(records[video['id']])
+        elif video['id'] in failedIds or video['id'] not in ids:
+            ret.append(video)
+        # Otherwise the API didn't return it, so it's been deleted or made
+        # private and there's no point keeping it
+
+    return ret
 
-            if 'nextPageToken' in res:
-                offset = res['nextPageToken']
+def FeedVideoRecord(item):
+    # A whole week of these is kept in the Data store, so only keep as much
+    # of the description as the clients show
+    record = VideoRecordFromItem(item)
+    if len(record['description']) > YT_FEED_DESCRIPTION_LENGTH:
+        record['description'] = \
+            record['description'][:YT_FEED_DESCRIPTION_LENGTH] + u'...'
 
-            if offset is None:
-                break
+    return record
 
-        channelsUpdated = channelsUpdated + 1
-        subscription_feed_update_progress = int((channelsUpdated * 100) / len(channelIds))
+def ChannelPollInterval(uploadCount, duration):
+    # Aim to poll a channel several times between uploads, so one that
+    # uploads daily is checked every few hours and one that has gone quiet
+    # only once a day
+    if not uploadCount:
+        return YT_MAX_POLL_INTERVAL_SECONDS
 
-    videos.sort(reverse = True, key = lambda tup: tup[1])
-    videoIds = [tup[0] for tup in videos]
+    interval = int(duration.total_seconds() / uploadCount / 6)
+
+    return max(
+        YT_MIN_POLL_INTERVAL_SECONDS,
+        min(YT_MAX_POLL_INTERVAL_SECONDS, interval)
+    )
+
+def IsChannelDue(state, timestamp):
+    if state is None or 'checked' not in state:
+        return True
+
+    return state['checked'] + state.get('interval', 0) <= timestamp
+
+def UpdateSubscriptionFeedWorker(duration = timedelta(weeks = 1)):
+    global subscription_feed_mutex
+    global subscription_feed_update_progress
+    global subscription_feed_live
+    global subscription_feed_saved
+
+    if not CheckToken():
+        return
+
+    subscription_feed_update_progress = 0
+    timestamp = int(time())
 
     subscription_feed_mutex.acquire()
     try:
-        Dict['last_refresh_time'] = int(time())
-        Data.SaveObject('subscription_feed', videoIds)
+        feed = LoadSubscriptionFeed()
     finally:
         subscription_feed_mutex.release()
 
+    # The subscription list rarely changes, so don't page through it every
+    # time a channel is due
+    if 'subscriptions' not in feed or feed['subscriptionsChecked'] + \
+            YT_SUBSCRIPTIONS_REFRESH_INTERVAL_SECONDS <= timestamp:
+        channelIds = GetSubscribedChannelIds()
+
+        if channelIds is None:
+            return
+
+        feed['subscriptions'] = channelIds
+        feed['subscriptionsChecked'] = timestamp
+    else:
+        channelIds = feed['subscriptions']
+
+    now = datetime.utcnow()
+    now = now.replace(hour = 0, minute = 0, second = 0, microsecond = 0)
+    cutoff = now - duration
+    rfc3339Cutoff = cutoff.isoformat('T') + 'Z'
+
+    subscription_feed_mutex.acquire()
+    try:
+        feed['videos'] = ExpireFeedVideos(
+            feed['videos'],
+            rfc3339Cutoff,
+            channelIds
+        )
+
+        for channelId in feed['channels'].keys():
+            if channelId not in channelIds:
+                del feed['channels'][channelId]
+
+        subscription_feed_live = feed
+    finally:
+        subscription_feed_mutex.release()
+
+    try:
+        channels = dict(feed['channels'])
+        knownIds = set(video['id'] for video in feed['videos'])
+        dueIds = [c for c in channelIds if IsChannelDue(channels.get(c), timestamp)]
+
+        # Leave the rest of the day's quota for browsing; the channels that have
+        # waited longest go first and the others stay due until next time
+        uploads = Prefs['feed_source'] == 'Uploads playlists'
+        affordable = int(QuotaRemaining(background=True) / \
+            QuotaCost('playlistItems' if uploads else 'search'))
+
+        if len(dueIds) > affordable:
+            Log.Info('Deferring %d channels to preserve quota' % (
+                len(dueIds) - max(affordable, 0)
+            ))
+            dueIds.sort(key=lambda c: channels.get(c, {}).get('checked', 0))
+            dueIds = dueIds[:max(affordable, 0)]
+
+        # Channels that have completed but not yet been merged into the feed,
+        # as (channelId, newest publishedAt or None, videos)
+        pending = []
+        pending_mutex = Lock()
+
+        def Publish(block):
+            # Merge everything that has completed so far in one go. If someone
+            # else holds the feed, leave it pending for whoever publishes next
+            if not subscription_feed_mutex.acquire(block):
+                return
+
+            try:
+                pending_mutex.acquire()
+                try:
+                    completed = pending[:]
+                    del pending[:]
+                finally:
+                    pending_mutex.release()
+
+                if not completed:
+                    return
+
+                feed['videos'] = MergeSortedVideos(
+                    [feed['videos']] + [videos for (c, n, videos) in completed]
+                )
+
+                for channelId, newest, videos in completed:
+                    state = feed['channels'].setdefault(channelId, {})
+                    state['checked'] = timestamp
+                    if newest is not None and state.get('newest', '') < newest:
+                        state['newest'] = newest
+            finally:
+                subscription_feed_mutex.release()
+
+        def PublishedAfter(channelId):
+            # Only ask for videos at least as new as the newest one we already
+            # have; the overlap is removed before merging
+            if channelId in channels and \
+                    channels[channelId].get('newest', '') > rfc3339Cutoff:
+                return channels[channelId]['newest']
+
+            return rfc3339Cutoff
+
+        if uploads:
+            # playlistItems costs 1 quota unit per page versus 100 for search
+            playlistIds = GetUploadsPlaylistIds(dueIds)
+            fetch = lambda channelId: GetUploadsFeedVideos(
+                channelId,
+                playlistIds.get(channelId),
+                PublishedAfter(channelId)
+            )
+        else:
+            fetch = lambda channelId: GetChannelFeedVideos(
+                channelId,
+                PublishedAfter(channelId)
+            )
+
+        def UpdateChannel(channelId):
+            channelVideos = fetch(channelId)
+
+            if channelVideos is None:
+                # The channel failed and should simply be retried from the same
+                # point next time
+                return
+
+            newest = None
+            if channelVideos:
+                newest = max(date for videoId, date in channelVideos)
+            videos = FillFeedVideoRecords([
+                {
+                    'id': videoId,
+                    'channelId': channelId,
+                    'publishedAt': date,
+                } for videoId, date in channelVideos if videoId not in knownIds
+            ])
+            videos.sort(reverse = True, key = lambda video: video['publishedAt'])
+
+            pending_mutex.acquire()
+            try:
+                pending.append((channelId, newest, videos))
+            finally:
+                pending_mutex.release()
+
+            Publish(False)
+
+        def OnProgress(done, total):
+            global subscription_feed_update_progress
+            subscription_feed_update_progress = int((done * 100) / total)
+
+        RunWorkerPool(
+            UpdateChannel,
+            dueIds,
+            int(Prefs['feed_concurrency']),
+            OnProgress
+        )
+        Publish(True)
+
+        # Pick up live state changes for anything that was already in the feed
+        videos = FillFeedVideoRecords(feed['videos'])
+
+        # Learn how often each channel uploads from what is in the feed window
+        uploadCounts = {}
+        for video in videos:
+            uploadCounts[video['channelId']] = \
+                uploadCounts.get(video['channelId'], 0) + 1
+
+        nextPoll = feed['subscriptionsChecked'] + \
+            YT_SUBSCRIPTIONS_REFRESH_INTERVAL_SECONDS
+
+        subscription_feed_mutex.acquire()
+        try:
+            for channelId in channelIds:
+                state = feed['channels'].setdefault(channelId, {})
+                state['interval'] = ChannelPollInterval(
+                    uploadCounts.get(channelId, 0),
+                    duration
+                )
+                nextPoll = min(nextPoll, state.get('checked', 0) + state['interval'])
+
+            feed['videos'] = videos
+            Dict['last_refresh_time'] = int(time())
+            Dict['next_feed_poll'] = nextPoll
+            Data.SaveObject('subscription_feed', feed)
+            subscription_feed_saved = feed
+        finally:
+            subscription_feed_mutex.release()
+    finally:
+        # Whether or not it worked, stop showing the feed as it was part
+        # way through the update
+        subscription_feed_mutex.acquire()
+        try:
+            subscription_feed_live = None
+        finally:
+            subscription_feed_mutex.release()
+
+    # The first couple of pages are what's most likely to be looked at
+    StartThumbWarmer([
+        video['thumb'] for video in videos[:int(Prefs['items_per_page']) * 2]
+        if video.get('thumb')
+    ])
+
 def UpdateSubscriptionFeed():
     global subscription_feed_thread
+    global subscription_feed_thread_mutex
 
-    if subscription_feed_thread is not None and not subscription_feed_thread.isAlive():
-        # There was a previous update, but it has finished
-        subscription_feed_thread = None
+    # This is called from both the scheduler and request handlers
+    subscription_feed_thread_mutex.acquire()
+    try:
+        if subscription_feed_thread is not None and not subscription_feed_thread.isAlive():
+            # There was a previous update, but it has finished
+            subscription_feed_thread = None
+
+        timeSinceRefreshStarted = 0
+        lastRefreshTime = 0
+        nextPoll = 0
+        now = int(time())
+
+        if 'last_refresh_time' in Dict:
+            lastRefreshTime = Dict['last_refresh_time']
+
+        if 'next_feed_poll' in Dict:
+            nextPoll = Dict['next_feed_poll']
+
+        if lastRefreshTime < now:
+            timeSinceRefreshStarted = now - lastRefreshTime
+
+        # Channels are only polled when they are due, so there's nothing to
+        # do until the earliest of them is
+        if subscription_feed_thread is None and \
+                ((timeSinceRefreshStarted > YT_MIN_REFRESH_INTERVAL_SECONDS and \
+                now >= nextPoll) or \
+                not Data.Exists('subscription_feed')):
+            # Start an update
+            subscription_feed_thread = Thread(target=UpdateSubscriptionFeedWorker)
+            subscription_feed_thread.start()
+    finally:
+        subscription_feed_thread_mutex.release()
 
-    timeSinceRefreshStarted = 0
-    lastRefreshTime = 0
-    now = int(time())
+def SubscriptionFeedScheduler():
+    while True:
+        try:
+            # Don't start polling for a device code from the background
+            if 'refresh_token' in Dict:
+                # Also keeps the access token refreshed ahead of time
+                CheckToken()
+                UpdateSubscriptionFeed()
+        except Exception as e:
+            Log.Error('Subscription feed scheduler exception: %s' % str(e))
 
-    if 'last_refresh_time' in Dict:
-        lastRefreshTime = Dict['last_refresh_time']
+        sleep(YT_SCHEDULER_TICK_SECONDS)
 
-    if lastRefreshTime < now:
-        timeSinceRefreshStarted = now - lastRefreshTime
+def StartSubscriptionFeedScheduler():
+    global subscription_feed_scheduler
 
-    if subscription_feed_thread is None and \
-            (timeSinceRefreshStarted > YT_MIN_REFRESH_INTERVAL_SECONDS or \
-            not Data.Exists('subscription_feed')):
-        # Start an update
-        subscription_feed_thread = Thread(target=UpdateSubscriptionFeedWorker)
-        subscription_feed_thread.start()
+    if subscription_feed_scheduler is None:
+        subscription_feed_scheduler = Thread(target=SubscriptionFeedScheduler)
+        subscription_feed_scheduler.daemon = True
+        subscription_feed_scheduler.start()
 
 @route(PREFIX + '/subscriptionfeed')
 def SubscriptionFeed(title, offset=0, refresh=0):
     global subscription_feed_thread
     global subscription_feed_mutex
     global subscription_feed_update_progress
+    global subscription_feed_live
+    global subscription_feed_saved
 
     refresh=bool(int(refresh))
     oc = ObjectContainer(title2=u'%s' % title,
@@ -335,27 +892,35 @@ def SubscriptionFeed(title, offset=0, refresh=0):
                 thumb=ICONS['watchHistory']
             ))
 
-    videoIds = []
     subscription_feed_mutex.acquire()
     try:
-        if Data.Exists('subscription_feed'):
-            videoIds = Data.LoadObject('subscription_feed')
+        # Show whatever an in progress update has found so far
+        if subscription_feed_live is not None:
+            videos = subscription_feed_live['videos']
+        else:
+            if subscription_feed_saved is None:
+                subscription_feed_saved = LoadSubscriptionFeed()
+            videos = subscription_feed_saved['videos']
     finally:
         subscription_feed_mutex.release()
 
-    if videoIds:
+    # Everything needed to render the feed is stored with it, so paging
+    # through it doesn't need any API requests
+    videos = [video for video in videos if 'title' in video]
+
+    if videos:
         offset = int(offset)
         perPage = int(Prefs['items_per_page'])
         pagelimit = offset + perPage
-        pagelimit = min(pagelimit, len(videoIds))
+        pagelimit = min(pagelimit, len(videos))
 
-        [AddVideos(
+        AddVideoRecords(
             oc,
-            ApiGetVideos(ids=videoIds[i:i + perPage]),
+            videos[offset:pagelimit],
             extended=Prefs['my_subscriptions_extened']
-        ) for i in xrange(offset, pagelimit, perPage)]
+        )
 
-        if pagelimit < len(videoIds):
+        if pagelimit < len(videos):
             oc.add(NextPageObject(
                 key = Callback(
                     SubscriptionFeed,
@@ -378,7 +943,7 @@ def VideoView(vid, **kwargs):
 
 
 @route(PREFIX + '/video/info')
-def VideoInfo(vid, pl_item_id=None):
+def VideoInfo(vid, pl_item_id=None, pl_id=None):
     oc = ObjectContainer()
     res = ApiGetVideos(ids=[vid])
 
@@ -421,7 +986,7 @@ def VideoInfo(vid, pl_item_id=None):
 
     if pl_item_id:
         oc.add(DirectoryObject(
-            key=Callback(PlaylistRemove, pl_item_id=pl_item_id),
+            key=Callback(PlaylistRemove, pl_item_id=pl_item_id, pl_id=pl_id),
             title=u'%s' % L('Remove from playlist'),
             thumb=ICONS['remove'],
         ))
@@ -434,12 +999,14 @@ def VideoInfo(vid, pl_item_id=None):
 
 @route(PREFIX + '/channels')
 def Channels(oid, title, offset=None):
-    res = ApiRequest('channels', ApiGetParams(
+    params = ApiGetParams(
         categoryId=oid,
         hl=GetLanguage(),
         limit=Prefs['items_per_page'],
-        offset=offset
-    ))
+        offset=offset,
+        fields='nextPageToken,items(id,snippet(title,description,thumbnails/high))'
+    )
+    res = ApiRequest('channels', params)
 
     if not res or not len(res['items']):
         return NoContents()
@@ -461,10 +1028,11 @@ def Channels(oid, title, offset=None):
             ),
             title=u'%s' % item['title'],
             summary=u'%s' % item['description'],
-            thumb=GetThumbFromSnippet(item),
+            thumb=CachedThumb(GetThumbFromSnippet(item)),
         ))
 
     if 'nextPageToken' in res:
+        PrefetchNextPage('channels', params, res['nextPageToken'])
         oc.add(NextPageObject(
             key=Callback(
                 Channels,
@@ -523,7 +1091,8 @@ def Channel(oid, title):
 def User(username):
     res = ApiRequest('channels', ApiGetParams(
         forUsername=username,
-        hl=GetLanguage()
+        hl=GetLanguage(),
+        fields='items(id,snippet/localized/title)'
     ))
 
     if not res or not len(res['items']):
@@ -538,7 +1107,8 @@ def User(username):
 def Categories(title, c_type):
     res = ApiRequest('%sCategories' % c_type, ApiGetParams(
         regionCode=GetRegion(),
-        hl=GetLanguage()
+        hl=GetLanguage(),
+        fields='items(id,snippet/title)'
     ))
 
     if not res or not len(res['items']):
@@ -581,12 +1151,14 @@ def Category(title, oid=0, offset=None):
         title2=u'%s' % title,
         replace_parent=bool(offset)
     )
+    # The next page link passes oid back as '0', which has to mean no
+    # category just like 0 does, or the request won't match the prefetch
     res = ApiGetVideos(
         chart='mostPopular',
         limit=Prefs['items_per_page'],
         offset=offset,
         regionCode=GetRegion(),
-        videoCategoryId=oid
+        videoCategoryId=oid if str(oid) != '0' else None
     )
     AddVideos(oc, res, extended=Prefs['category_extened'])
 
@@ -633,12 +1205,14 @@ def Playlists(uid, title, offset=None):
 @route(PREFIX + '/playlist')
 def Playlist(oid, title, can_edit=False, offset=None):
 
-    res = ApiRequest('playlistItems', ApiGetParams(
+    params = ApiGetParams(
         part='contentDetails',
         playlistId=oid,
         offset=offset,
-        limit=Prefs['items_per_page']
-    ))
+        limit=Prefs['items_per_page'],
+        fields='nextPageToken,items(id,contentDetails/videoId)'
+    )
+    res = ApiRequest('playlistItems', params)
 
     if not res or not len(res['items']):
         return NoContents()
@@ -661,10 +1235,19 @@ def Playlist(oid, title, can_edit=False, offset=None):
         oc,
         ApiGetVideos(ids=ids),
         extended=Prefs['playlists_extened'],
-        pl_map=pl_map
+        pl_map=pl_map,
+        pl_id=oid
     )
 
     if 'nextPageToken' in res:
+        PrefetchNextPage(
+            'playlistItems',
+            params,
+            res['nextPageToken'],
+            videoIds=lambda page: [
+                item['contentDetails']['videoId'] for item in page['items']
+            ]
+        )
         oc.add(NextPageObject(
             key=Callback(
                 Playlist,
@@ -698,7 +1281,7 @@ def PlaylistAdd(aid, key=None, oid=None, a_type='video'):
                 a_type+'Id': aid,
             }
         }
-    })
+    }, invalidate=PlaylistCacheMatchers(oid))
 
     if not res:
         return ErrorMessage()
@@ -706,13 +1289,27 @@ def PlaylistAdd(aid, key=None, oid=None, a_type='video'):
     return SuccessMessage()
 
 
-def PlaylistRemove(pl_item_id):
-    if ApiRequest('playlistItems', {'id': pl_item_id}, rmethod='DELETE'):
+def PlaylistRemove(pl_item_id, pl_id=None):
+    if ApiRequest(
+        'playlistItems',
+        {'id': pl_item_id},
+        rmethod='DELETE',
+        invalidate=PlaylistCacheMatchers(pl_id)
+    ):
         return SuccessMessage()
 
     return ErrorMessage()
 
 
+def PlaylistCacheMatchers(oid):
+    # Changing a playlist affects its pages, and may change which of our own
+    # playlists are listed on the channel if it was empty before
+    return [
+        ApiCacheMatcher('playlistItems', playlistId=oid),
+        ApiCacheMatcher('channels', mine='true'),
+    ]
+
+
 @route(PREFIX + '/subscriptions')
 def Subscriptions(uid, title, offset=None):
     oc = ObjectContainer(
@@ -722,18 +1319,28 @@ def Subscriptions(uid, title, offset=None):
     return AddSubscriptions(oc, uid=uid, offset=offset)
 
 
-def AddVideos(oc, res, title=None, extended=False, pl_map={}):
+def AddVideos(oc, res, title=None, extended=False, pl_map={}, pl_id=None):
     if not res or not len(res['items']):
         return oc
 
-    for item in res['items']:
-        snippet = item['snippet']
+    return AddVideoRecords(
+        oc,
+        [VideoRecordFromItem(item) for item in res['items']],
+        title=title,
+        extended=extended,
+        pl_map=pl_map,
+        pl_id=pl_id
+    )
+
 
+def AddVideoRecords(oc, records, title=None, extended=False, pl_map={},
+    pl_id=None):
+    for record in records:
         # Skip upcoming videos; we only want things we can actually watch
-        if 'liveBroadcastContent' in snippet and snippet['liveBroadcastContent'] == 'upcoming':
+        if record['live'] == 'upcoming':
             continue
 
-        seconds = Video.ParseDuration(item['contentDetails']['duration'])
+        seconds = record['duration']
         milliseconds = seconds * 1000
 
         if Prefs['duration_in_description']:
@@ -741,36 +1348,59 @@ def AddVideos(oc, res, title=None, extended=False, pl_map={}):
         else:
             durationString = ''
 
-        summary = u'%s%s\n%s' % (durationString, snippet['channelTitle'], snippet['description'])
+        summary = u'%s%s\n%s' % (durationString, record['channelTitle'], record['description'])
 
         if extended:
-            pl_item_id = pl_map[item['id']] if item['id'] in pl_map else None
+            pl_item_id = pl_map[record['id']] if record['id'] in pl_map else None
             oc.add(DirectoryObject(
-                key=Callback(VideoInfo, vid=item['id'], pl_item_id=pl_item_id),
-                title=u'%s' % snippet['title'],
+                key=Callback(
+                    VideoInfo,
+                    vid=record['id'],
+                    pl_item_id=pl_item_id,
+                    pl_id=pl_id
+                ),
+                title=u'%s' % record['title'],
                 summary=summary,
-                thumb=GetThumbFromSnippet(snippet),
+                thumb=CachedThumb(record['thumb']),
                 duration=milliseconds,
             ))
         else:
             oc.add(VideoClipObject(
-                key=Callback(VideoView, vid=item['id']),
-                rating_key=Video.GetServiceURL(item['id']),
-                title=u'%s' % snippet['title'] if title is None else title,
+                key=Callback(VideoView, vid=record['id']),
+                rating_key=Video.GetServiceURL(record['id']),
+                title=u'%s' % record['title'] if title is None else title,
                 summary=summary,
-                thumb=GetThumbFromSnippet(snippet),
+                thumb=CachedThumb(record['thumb']),
                 duration=milliseconds,
                 originally_available_at=Datetime.ParseDate(
-                    snippet['publishedAt']
+                    record['publishedAt']
                 ).date(),
                 items=URLService.MediaObjectsForURL(
-                    Video.GetServiceURL(item['id'], Dict['access_token'])
+                    Video.GetServiceURL(record['id'], Dict['access_token'])
                 )
             ))
 
     return oc
 
 
+def VideoRecordFromItem(item):
+    # The subset of a videos resource needed to render it, compact enough
+    # to keep a week of subscriptions in the Data store
+    snippet = item['snippet']
+
+    return {
+        'id': item['id'],
+        'title': snippet['title'],
+        'description': snippet['description'],
+        'channelId': snippet['channelId'],
+        'channelTitle': snippet['channelTitle'],
+        'publishedAt': snippet['publishedAt'],
+        'duration': Video.ParseDuration(item['contentDetails']['duration']),
+        'thumb': GetThumbFromSnippet(snippet),
+        'live': snippet.get('liveBroadcastContent', 'none'),
+    }
+
+
 def FillChannelInfo(oc, uid):
     info = ApiGetChannelInfo(uid)
 
@@ -798,12 +1428,15 @@ def FillChannelInfo(oc, uid):
 
 
 def AddPlaylists(oc, uid, offset=None):
-    res = ApiRequest('playlists', ApiGetParams(
+    params = ApiGetParams(
         uid=uid,
         limit=GetLimitForOC(oc),
         offset=offset,
-        hl=GetLanguage()
-    ))
+        hl=GetLanguage(),
+        fields='nextPageToken,items(id,snippet(localized(title,description),'
+               'thumbnails/high))'
+    )
+    res = ApiRequest('playlists', params)
 
     if res:
         if 'items' in res:
@@ -820,10 +1453,17 @@ def AddPlaylists(oc, uid, offset=None):
                     ),
                     title=u'%s' % item['localized']['title'],
                     summary=u'%s' % item['localized']['description'],
-                    thumb=GetThumbFromSnippet(item),
+                    thumb=CachedThumb(GetThumbFromSnippet(item)),
                 ))
 
         if 'nextPageToken' in res:
+            # The next page is listed on its own, so gets a full page
+            PrefetchNextPage(
+                'playlists',
+                params,
+                res['nextPageToken'],
+                limit=Prefs['items_per_page']
+            )
             oc.add(NextPageObject(
                 key=Callback(
                     Playlists,
@@ -842,12 +1482,15 @@ def AddPlaylists(oc, uid, offset=None):
 
 
 def AddSubscriptions(oc, uid, offset=None):
-    res = ApiRequest('subscriptions', ApiGetParams(
+    params = ApiGetParams(
         uid=uid,
         limit=GetLimitForOC(oc),
         offset=offset,
-        order=str(Prefs['subscriptions_order']).lower()
-    ))
+        order=str(Prefs['subscriptions_order']).lower(),
+        fields='nextPageToken,items(snippet(title,description,'
+               'resourceId/channelId,thumbnails/high))'
+    )
+    res = ApiRequest('subscriptions', params)
 
     if res:
         if 'items' in res:
@@ -861,11 +1504,18 @@ def AddSubscriptions(oc, uid, offset=None):
                     ),
                     title=u'%s' % item['title'],
                     summary=u'%s' % item['description'],
-                    thumb=GetThumbFromSnippet(item),
+                    thumb=CachedThumb(GetThumbFromSnippet(item)),
                 ))
 
         if 'nextPageToken' in res:
             offset = res['nextPageToken']
+            # The next page is listed on its own, so gets a full page
+            PrefetchNextPage(
+                'subscriptions',
+                params,
+                offset,
+                limit=Prefs['items_per_page']
+            )
             oc.add(NextPageObject(
                 key=Callback(
                     Subscriptions,
@@ -889,53 +1539,93 @@ def AddItemsFromDescription(oc, description):
     if not len(links):
         return oc;
 
-    for (ext_title, url) in links:
-        ext_title = ext_title.strip()
+    links = [
+        (ext_title.strip(), url) + Video.ClassifyURL(url)
+        for (ext_title, url) in links
+    ]
+
+    # Only links that couldn't be recognised need their page downloading
+    unknown = list(set([url for (t, url, kind, oid) in links if kind is None]))
+    resolved = dict(zip(unknown, RunWorkerPool(
+        ResolveDescriptionLink,
+        unknown,
+        YT_LINK_RESOLVE_CONCURRENCY
+    )))
+
+    items = []
+    for (ext_title, url, kind, oid) in links:
+        if kind is None:
+            if not resolved[url]:
+                continue
+            kind, oid = 'video', resolved[url]
+        items.append((ext_title, kind, oid))
+
+    # Look all the videos up at once for their proper titles and thumbnails
+    vids = []
+    for (ext_title, kind, oid) in items:
+        if kind == 'video' and oid not in vids:
+            vids.append(oid)
+
+    videos = {}
+    if vids:
+        res = ApiGetVideos(ids=vids)
+        if res:
+            for item in res['items']:
+                videos[item['id']] = item['snippet']
 
-        if '/user/' in url:
+    for (ext_title, kind, oid) in items:
+        if kind == 'user':
             oc.add(DirectoryObject(
-                key=Callback(User, username=Video.GetOID(url)),
+                key=Callback(User, username=oid),
                 title=u'[*] %s' % ext_title,
             ))
-            continue
-        elif '/channel/' in url:
+        elif kind == 'channel':
             oc.add(DirectoryObject(
-                key=Callback(Channel, oid=Video.GetOID(url), title=ext_title),
+                key=Callback(Channel, oid=oid, title=ext_title),
                 title=u'[*] %s' % ext_title,
             ))
-            continue
-
-        try:
-            ext_vid = URLService.NormalizeURL(url)
-        except:
-            continue
-
-        if ext_vid is None:
-            continue
-
-        if 'playlist?' in ext_vid:
-            ext_vid = ext_vid[ext_vid.rfind('list=')+5:]
+        elif kind == 'playlist':
             oc.add(DirectoryObject(
-                key=Callback(Playlist, oid=ext_vid, title=ext_title),
+                key=Callback(Playlist, oid=oid, title=ext_title),
                 title=u'[*] %s' % ext_title
             ))
+        elif oid in videos:
+            oc.add(DirectoryObject(
+                key=Callback(VideoInfo, vid=oid),
+                title=u'[*] %s' % videos[oid]['title'],
+                thumb=CachedThumb(GetThumbFromSnippet(videos[oid]))
+            ))
         else:
-            ext_vid = Video.GetOID(ext_vid)
             oc.add(DirectoryObject(
-                key=Callback(VideoInfo, vid=ext_vid),
+                key=Callback(VideoInfo, vid=oid),
                 title=u'[*] %s' % ext_title,
-                thumb=Video.GetThumb(ext_vid)
+                thumb=CachedThumb(Video.GetThumb(oid))
             ))
 
     return oc
 
 
+def ResolveDescriptionLink(url):
+    # Returns the id of the video a link leads to, or None; the URL service
+    # remembers pages it has downloaded, but not ones that failed to load
+    try:
+        vid = URLService.NormalizeURL(url)
+    except Exception as e:
+        Log.Debug('Could not resolve link %s: %s' % (url, e))
+        return None
+
+    if vid is None:
+        return None
+
+    return Video.GetOID(vid)
+
+
 def Search(query=None, title=L('Search'), s_type='video', offset=0, **kwargs):
     if not query and not kwargs:
         return NoContents()
 
     is_video = s_type == 'video'
-    res = ApiRequest('search', ApiGetParams(
+    params = ApiGetParams(
         part='id' if is_video else 'snippet',
         q=query,
         type=s_type,
@@ -943,8 +1633,12 @@ def Search(query=None, title=L('Search'), s_type='video', offset=0, **kwargs):
         videoDefinition='high' if is_video and Prefs['search_hd'] else '',
         offset=offset,
         limit=Prefs['items_per_page'],
+        fields='nextPageToken,items(id/videoId)' if is_video else
+               'nextPageToken,items(id(channelId,playlistId),'
+               'snippet(title,description,thumbnails/high))',
         **kwargs
-    ))
+    )
+    res = ApiRequest('search', params)
 
     if not res or not len(res['items']):
         return NoContents()
@@ -975,7 +1669,7 @@ def Search(query=None, title=L('Search'), s_type='video', offset=0, **kwargs):
                 ),
                 title=u'%s' % item['title'],
                 summary=u'%s' % item['description'],
-                thumb=GetThumbFromSnippet(item),
+                thumb=CachedThumb(GetThumbFromSnippet(item)),
             ))
 
     if 'nextPageToken' in res:
@@ -1074,6 +1768,53 @@ def NotImplemented(**kwargs):
     )
 
 
+def RunWorkerPool(worker, items, concurrency, progress=None):
+    '''
+    Call worker for every item using at most concurrency threads. Results
+    are returned in the same order as items; a worker that raises yields None.
+    '''
+    results = [None] * len(items)
+    if not items:
+        return results
+
+    queue = Queue()
+    for job in enumerate(items):
+        queue.put(job)
+
+    mutex = Lock()
+    status = {'done': 0}
+
+    def Run():
+        while True:
+            try:
+                i, item = queue.get_nowait()
+            except Empty:
+                return
+
+            try:
+                results[i] = worker(item)
+            except Exception as e:
+                Log.Error('Worker exception: %s' % str(e))
+
+            mutex.acquire()
+            try:
+                status['done'] = status['done'] + 1
+                if progress is not None:
+                    progress(status['done'], len(items))
+            finally:
+                mutex.release()
+
+    threads = [
+        Thread(target=Run) for i in xrange(max(1, min(concurrency, len(items))))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
 def GetRegion():
     return Prefs['region'].split('/')[1]
 
@@ -1094,21 +1835,194 @@ def GetThumbFromSnippet(snippet):
         return ''
 
 
-def ApiGetVideos(ids=[], title=None, extended=False, **kwargs):
-    return ApiRequest('videos', ApiGetParams(
-        part='snippet,contentDetails',
-        hl=GetLanguage(),
-        id=','.join(ids),
-        **kwargs
-    ))
+def CachedThumb(url):
+    if not url:
+        return url
+
+    return Callback(Thumbnail, url=url)
+
+
+@route(PREFIX + '/thumb')
+def Thumbnail(url):
+    entry = FetchThumb(url)
+    if entry is None:
+        # Let the client try for itself
+        return Redirect(url)
+
+    return DataObject(entry['data'], entry['type'])
+
+
+def SizedThumbUrl(url):
+    # Swap a video thumbnail for the size the clients are set to use
+    match = RE_VIDEO_THUMB.search(url)
+    if match is None:
+        return url
+
+    return '%s%s.jpg' % (
+        match.group(1),
+        YT_THUMB_VARIANTS.get(Prefs['thumb_size'], 'hqdefault')
+    )
+
+
+def FetchThumb(url):
+    if not RE_THUMB_HOST.search(url):
+        return None
+
+    sized = SizedThumbUrl(url)
+    entry = thumb_cache.Get(sized)
+    if entry is not None and entry['expires'] > time():
+        return entry
+
+    # Not every video has the larger sizes, so fall back to the original
+    for candidate in [sized] if sized == url else [sized, url]:
+        try:
+            res = api_transport.Fetch(candidate)
+        except Exception as e:
+            Log.Debug('Could not get thumbnail %s: %s' % (candidate, e))
+            continue
+
+        content_type = res.headers.get('content-type', '')
+        if res.status != 200 or not content_type.startswith('image/'):
+            Log.Debug('Not a thumbnail %s: %s %s' % (
+                candidate,
+                res.status,
+                content_type
+            ))
+            continue
+
+        entry = {
+            'data': res.content,
+            'type': content_type,
+            'expires': time() + YT_THUMB_CACHE_TIME,
+        }
+        thumb_cache.Set(sized, entry)
+        return entry
+
+    return entry
+
+
+def StartThumbWarmer(urls):
+    # Download thumbnails ahead of time without holding up the caller
+    def Warm():
+        RunWorkerPool(FetchThumb, urls, YT_PREFETCH_CONCURRENCY)
+
+    thread = Thread(target=Warm)
+    thread.daemon = True
+    thread.start()
+
+
+def PrefetchNextPage(method, params, offset, videoIds=None, limit=None):
+    '''
+    Download the page after the one just listed in the background, so that
+    it is already cached when the user asks for it. videoIds picks out the
+    videos on the page that need looking up as well.
+    '''
+    # Only cheap reads are worth guessing at; a search costs 100 units
+    # whether or not the user ever looks at the page
+    if QuotaCost(method) > 1:
+        return
+
+    if not prefetch_slots.acquire(False):
+        return
+
+    params = dict(params, pageToken=offset)
+    if limit:
+        params['maxResults'] = limit
+
+    def Prefetch():
+        try:
+            # As background work this can't eat into the quota for browsing
+            res = ApiRequest(
+                method,
+                params,
+                suppressErrorMessage=True,
+                background=True
+            )
+            if res and 'items' in res and videoIds is not None:
+                ids = videoIds(res)
+                if ids:
+                    ApiGetVideos(ids=ids, background=True)
+        except Exception as e:
+            Log.Error('Prefetch exception: %s' % str(e))
+        finally:
+            prefetch_slots.release()
+
+    thread = Thread(target=Prefetch)
+    thread.daemon = True
+    thread.start()
+
+
+def ApiGetVideos(ids=[], title=None, extended=False, background=False, **kwargs):
+    hl = GetLanguage()
+
+    if not ids:
+        params = ApiGetParams(
+            part='snippet,contentDetails',
+            hl=hl,
+            fields=YT_VIDEO_FIELDS,
+            **kwargs
+        )
+        res = ApiRequest('videos', params, background=background)
+        CacheVideoItems(res, hl)
+
+        # A chart, which the user may well page through
+        if res and 'nextPageToken' in res and not background:
+            PrefetchNextPage('videos', params, res['nextPageToken'])
+
+        return res
+
+    now = time()
+    items = {}
+    missing = []
+
+    for vid in ids:
+        entry = api_video_cache.Get((hl, vid))
+        if entry is not None and entry[0] > now:
+            items[vid] = entry[1]
+        elif vid not in missing:
+            missing.append(vid)
+
+    for i in xrange(0, len(missing), 50): # Max allowed by API
+        res = ApiRequest('videos', ApiGetParams(
+            part='snippet,contentDetails',
+            hl=hl,
+            id=','.join(missing[i:i + 50]),
+            fields=YT_VIDEO_FIELDS,
+            **kwargs
+        ), background=background)
+
+        # Callers need to be able to tell a failure from deleted videos
+        if not res or 'items' not in res:
+            return None
+
+        CacheVideoItems(res, hl)
+        for item in res['items']:
+            items[item['id']] = item
+
+    return {'items': [items[vid] for vid in ids if vid in items]}
+
+
+def CacheVideoItems(res, hl):
+    if not res or 'items' not in res:
+        return
+
+    expires = time() + YT_CACHE_TIMES['videos']
+    for item in res['items']:
+        api_video_cache.Set((hl, item['id']), (expires, item))
 
 
 def ApiGetChannelInfo(uid):
+    entry = api_channel_info.Get(uid)
+    if entry is not None and entry[0] > time():
+        return entry[1]
+
     res = ApiRequest('channels', ApiGetParams(
         part='contentDetails,brandingSettings',
         hl=GetLanguage(),
         uid=uid,
-        id=uid if uid != 'me' else None
+        id=uid if uid != 'me' else None,
+        fields='items(contentDetails/relatedPlaylists,'
+               'brandingSettings/image/bannerTvHighImageUrl)'
     ))
 
     ret = {
@@ -1116,25 +2030,34 @@ def ApiGetChannelInfo(uid):
         'banner': None
     }
 
-    if res and res['items']:
-        res = res['items'][0]
-        relatedPlaylists = res['contentDetails']['relatedPlaylists']
+    if not res or not res['items']:
+        return ret
 
-        for key in relatedPlaylists:
-            # Check that the API actually returns the playlist without error
-            res = ApiRequest('playlistItems', ApiGetParams(
-                part='contentDetails',
-                playlistId=relatedPlaylists[key]
-            ),
-            suppressErrorMessage=True)
-            if res and len(res['items']):
-                ret['playlists'][key] = relatedPlaylists[key]
+    channel = res['items'][0]
+    relatedPlaylists = channel['contentDetails']['relatedPlaylists']
 
-        try:
-            ret['banner'] = res['brandingSettings']['image']['bannerTvHighImageUrl']
-        except:
-            pass
+    def Probe(key):
+        # Check that the API actually returns the playlist without error
+        res = ApiRequest('playlistItems', ApiGetParams(
+            part='id',
+            playlistId=relatedPlaylists[key],
+            limit='1',
+            fields='items/id'
+        ),
+        suppressErrorMessage=True)
+        return bool(res and len(res['items']))
+
+    keys = relatedPlaylists.keys()
+    for key, found in zip(keys, RunWorkerPool(Probe, keys, len(keys))):
+        if found:
+            ret['playlists'][key] = relatedPlaylists[key]
+
+    try:
+        ret['banner'] = channel['brandingSettings']['image']['bannerTvHighImageUrl']
+    except:
+        pass
 
+    api_channel_info.Set(uid, (time() + YT_CHANNEL_INFO_CACHE_TIME, ret))
     return ret
 
 
@@ -1167,16 +2090,33 @@ def ApiRequestErrorOccurred(response, suppressErrorMessage=False):
     return errorOccurred
 
 
-def ApiRequest(method, params, data=None, rmethod=None, suppressErrorMessage=False):
+def ApiRequest(method, params, data=None, rmethod=None, suppressErrorMessage=False,
+    timeout=None, cacheTime=None, invalidate=None, background=False):
     if not CheckToken():
         return None
 
-    params['access_token'] = Dict['access_token']
+    if not data and rmethod != 'DELETE':
+        # The parsed result is shared between everyone who asked for it at
+        # the same time, so callers must treat it as read only
+        return api_reads_in_flight.Do(
+            ApiRequestKey(method, params),
+            lambda: ApiRead(
+                method,
+                params,
+                suppressErrorMessage,
+                timeout,
+                cacheTime,
+                background
+            )
+        )
 
-    is_change = data or rmethod == 'DELETE'
+    ChargeQuota(method, YT_QUOTA_WRITE_COST)
+    params['access_token'] = Dict['access_token']
 
     try:
-        res = HTTP.Request(
+        ApiFetch(
+            method,
+            YT_QUOTA_WRITE_COST,
             'https://www.googleapis.com/youtube/%s/%s?%s' % (
                 YT_VERSION,
                 method,
@@ -1185,28 +2125,285 @@ def ApiRequest(method, params, data=None, rmethod=None, suppressErrorMessage=Fal
             headers={'Content-Type': 'application/json; charset=UTF-8'},
             data=None if not data else JSON.StringFromObject(data),
             method=rmethod,
-            cacheTime=0 if is_change else CACHE_1HOUR
-        ).content
+            timeout=timeout,
+            idempotent=False
+        )
     except Exception as e:
-        if not suppressErrorMessage:
-            Log.Error('Exception: %s' % str(e))
-            if hasattr(e, 'content'):
-                ApiRequestErrorOccurred(e.content)
+        ApiRequestFailed(e, suppressErrorMessage)
         return None
 
-    if is_change:
-        HTTP.ClearCache()
-        return True
+    if invalidate is None:
+        # Nothing to go on, so anything might be out of date
+        api_cache.Clear()
+        api_channel_info.Clear()
+    else:
+        for matcher in invalidate:
+            api_cache.Invalidate(matcher)
+
+        # One of our own playlists may have become empty, or stopped being so
+        api_channel_info.Delete('me')
+
+    return True
+
+
+def ApiRead(method, params, suppressErrorMessage=False, timeout=None,
+    cacheTime=None, background=False):
+    key = ApiRequestKey(method, params)
+    entry = api_cache.Get(key)
+    now = time()
+
+    if cacheTime is None:
+        cacheTime = YT_CACHE_TIMES.get(method, CACHE_1HOUR)
+
+    if entry is not None and entry['expires'] > now and cacheTime > 0:
+        return entry['data']
+
+    if not ChargeQuota(method, QuotaCost(method), background):
+        Log.Debug('Deferring background %s request to preserve quota' % method)
+        return None
+
+    headers = {'Content-Type': 'application/json; charset=UTF-8'}
+
+    # A stale entry can be revalidated; if it hasn't changed the API
+    # answers 304 with no body, and there's nothing to download or parse
+    if entry is not None and entry['etag']:
+        headers['If-None-Match'] = entry['etag']
+
+    params['access_token'] = Dict['access_token']
 
     try:
-        res = JSON.ObjectFromString(res)
+        res = ApiFetch(
+            method,
+            QuotaCost(method),
+            'https://www.googleapis.com/youtube/%s/%s?%s' % (
+                YT_VERSION,
+                method,
+                urlencode(params)
+            ),
+            headers=headers,
+            timeout=timeout,
+            background=background
+        )
+    except Exception as e:
+        ApiRequestFailed(e, suppressErrorMessage)
+        return None
+
+    if res.status == 304 and entry is not None:
+        entry = dict(entry)
+        entry['expires'] = now + cacheTime
+        api_cache.Set(key, entry)
+        return entry['data']
+
+    try:
+        data = JSON.ObjectFromString(res.content)
     except:
         return None
 
-    if ApiRequestErrorOccurred(res, suppressErrorMessage):
+    if ApiRequestErrorOccurred(data, suppressErrorMessage):
         return None
 
-    return res
+    api_cache.Set(key, {
+        'data': data,
+        'etag': data.get('etag', res.headers.get('etag')),
+        'expires': now + cacheTime,
+    })
+
+    return data
+
+
+def ApiFetch(method, cost, url, background=False, idempotent=True, **kwargs):
+    # The first attempt has already been charged by the caller
+    policy = api_retry_background if background else api_retry
+    attempt = 0
+
+    while True:
+        if not api_circuit.Allow():
+            raise CircuitOpenError(
+                'YouTube API is failing, not sending %s request' % method
+            )
+
+        try:
+            res = api_transport.Fetch(url, **kwargs)
+        except Exception as e:
+            # Every request Allow() let through has to report back, or a
+            # trial request would leave the circuit open for good
+            ReportApiFailure(e)
+
+            if not IsRetryableApiError(e, idempotent):
+                raise
+
+            delay = policy.Delay(attempt, RetryAfter(e))
+            if delay is None:
+                raise
+
+            Log.Debug('Retrying %s request in %.1fs: %s' % (method, delay, e))
+            sleep(delay)
+            ChargeQuota(method, cost)
+            attempt += 1
+            continue
+
+        api_circuit.Success()
+        return res
+
+
+def ReportApiFailure(e):
+    if isinstance(e, TransportError):
+        # Server errors and rate limiting, even on writes we won't repeat
+        if IsRetryableApiError(e):
+            api_circuit.Failure()
+        else:
+            # The API answered, so it's healthy enough
+            api_circuit.Success()
+    elif isinstance(e, (socket.error, httplib.HTTPException)):
+        api_circuit.Failure()
+    else:
+        api_circuit.Abandon()
+
+
+def IsRetryableApiError(e, idempotent=True):
+    if isinstance(e, TransportError):
+        if e.code == 429:
+            return True
+
+        if e.code == 403:
+            # As opposed to quotaExceeded, which lasts until tomorrow
+            return 'rateLimitExceeded' in e.content or \
+                'userRateLimitExceeded' in e.content
+
+        # Anything else may have been acted on, so only repeat reads
+        return e.code >= 500 and idempotent
+
+    return idempotent and isinstance(e, (socket.error, httplib.HTTPException))
+
+
+def RetryAfter(e):
+    try:
+        return max(0, int(e.headers['retry-after']))
+    except:
+        return None
+
+
+def ApiRequestFailed(e, suppressErrorMessage=False):
+    CheckQuotaExceeded(e)
+
+    if suppressErrorMessage:
+        return
+
+    if isinstance(e, CircuitOpenError):
+        Log.Debug(str(e))
+        return
+
+    Log.Error('Exception: %s' % str(e))
+    if hasattr(e, 'content'):
+        ApiRequestErrorOccurred(e.content)
+
+
+def QuotaCost(method):
+    return YT_QUOTA_COSTS.get(method, 1)
+
+
+def QuotaDay():
+    # The quota resets at midnight Pacific time, which is UTC-7 from 2am on
+    # the second Sunday of March until 2am on the first Sunday of November
+    # and UTC-8 the rest of the year
+    def Sunday(year, month, n):
+        first = datetime(year, month, 1)
+        return first + timedelta(days=(6 - first.weekday()) % 7 + 7 * (n - 1))
+
+    now = datetime.utcnow()
+    dst_start = Sunday(now.year, 3, 2) + timedelta(hours=10)
+    dst_end = Sunday(now.year, 11, 1) + timedelta(hours=9)
+    offset = 7 if dst_start <= now < dst_end else 8
+
+    return (now - timedelta(hours=offset)).strftime('%Y-%m-%d')
+
+
+def LoadQuota():
+    # Units used per method today; callers hold quota_mutex
+    quota = Dict['quota'] if 'quota' in Dict else None
+    if not quota or quota['day'] != QuotaDay():
+        quota = {'day': QuotaDay(), 'used': {}}
+
+    return quota
+
+
+def QuotaBudget(background=False):
+    budget = int(Prefs['daily_quota'])
+    if background:
+        budget = int(budget * (1 - YT_QUOTA_INTERACTIVE_RESERVE))
+
+    return budget
+
+
+def QuotaRemaining(background=False):
+    quota_mutex.acquire()
+    try:
+        used = sum(LoadQuota()['used'].values())
+    finally:
+        quota_mutex.release()
+
+    return QuotaBudget(background) - used
+
+
+def ChargeQuota(method, cost, background=False):
+    # Browsing is always let through; the API will refuse it itself if the
+    # quota really has run out
+    quota_mutex.acquire()
+    try:
+        quota = LoadQuota()
+        used = sum(quota['used'].values())
+
+        if background and used + cost > QuotaBudget(background):
+            return False
+
+        quota['used'][method] = quota['used'].get(method, 0) + cost
+        Dict['quota'] = quota
+    finally:
+        quota_mutex.release()
+
+    return True
+
+
+def CheckQuotaExceeded(e):
+    # If the API says the quota has run out, believe it over our own tally
+    if 'quotaExceeded' not in str(getattr(e, 'content', '')):
+        return
+
+    quota_mutex.acquire()
+    try:
+        quota = LoadQuota()
+        used = sum(quota['used'].values())
+        quota['used']['exceeded'] = quota['used'].get('exceeded', 0) + \
+            max(0, QuotaBudget() - used)
+        Dict['quota'] = quota
+    finally:
+        quota_mutex.release()
+
+
+def ApiCacheMatcher(method, **kwargs):
+    # Matches the cache keys of method requests made with all of kwargs; a
+    # value of None matches anything
+    def Match(key):
+        if key[0] != method:
+            return False
+
+        params = dict(key[1])
+        for name, val in kwargs.items():
+            if val is not None and params.get(name) != u'%s' % val:
+                return False
+
+        return True
+
+    return Match
+
+
+def ApiRequestKey(method, params):
+    # Normalised so the same request built in a different order, or with a
+    # different token, is still recognised as the same
+    return (method, tuple(sorted(
+        (key, u'%s' % val) for key, val in params.items()
+        if key != 'access_token'
+    )))
 
 
 def ApiGetParams(part='snippet', offset=None, limit=None, uid=None, **kwargs):
@@ -1226,40 +2423,111 @@ def ApiGetParams(part='snippet', offset=None, limit=None, uid=None, **kwargs):
         params['maxResults'] = limit
 
     params.update(filter(lambda v: v[1], kwargs.items()))
+
+    if 'fields' in params:
+        # Cached responses are revalidated by their etag
+        params['fields'] = 'etag,' + params['fields']
+
     return params
 
 
 def CheckToken():
     if CheckAccessData('access_token'):
+        if Dict['expires'] - YT_TOKEN_REFRESH_MARGIN_SECONDS < int(time()):
+            # Still valid for now, so nobody needs to wait for the refresh
+            StartTokenRefresh()
         return True
 
-    if 'refresh_token' in Dict:
-        res = OAuthRequest({
-            'refresh_token': Dict['refresh_token'],
-            'grant_type': 'refresh_token',
-        })
-        if res:
-            StoreAccessData(res)
+    # Whoever gets here first refreshes the token, and everyone else waiting
+    # on the lock then finds it already done
+    token_mutex.acquire()
+    try:
+        if CheckAccessData('access_token'):
             return True
 
-    if CheckAccessData('device_code'):
-        res = OAuthRequest({
-            'code': Dict['device_code'],
-            'grant_type': 'http://oauth.net/grant_type/device/1.0',
-        })
-        if res:
-            StoreAccessData(res)
+        if RefreshToken():
             return True
 
+        if CheckAccessData('device_code'):
+            res = OAuthRequest({
+                'code': Dict['device_code'],
+                'grant_type': 'http://oauth.net/grant_type/device/1.0',
+            })
+            if res:
+                StoreAccessData(res)
+                return True
+    finally:
+        token_mutex.release()
+
+    return False
+
+
+def RefreshToken():
+    # Callers hold token_mutex
+    if 'refresh_token' not in Dict:
+        return False
+
+    res = OAuthRequest({
+        'refresh_token': Dict['refresh_token'],
+        'grant_type': 'refresh_token',
+    })
+    if res:
+        StoreAccessData(res)
+        return True
+
     return False
 
 
+def StartTokenRefresh():
+    global token_refresh_thread
+
+    # If the lock is taken a refresh is already under way
+    if not token_mutex.acquire(False):
+        return
+
+    try:
+        if token_refresh_thread is None or not token_refresh_thread.isAlive():
+            token_refresh_thread = Thread(target=BackgroundTokenRefresh)
+            token_refresh_thread.daemon = True
+            token_refresh_thread.start()
+    finally:
+        token_mutex.release()
+
+
+def BackgroundTokenRefresh():
+    token_mutex.acquire()
+    try:
+        # Somebody else may have got there first
+        if Dict['expires'] - YT_TOKEN_REFRESH_MARGIN_SECONDS < int(time()):
+            RefreshToken()
+    finally:
+        token_mutex.release()
+
+
 def ResetToken():
-    del Dict['access_token']
-    del Dict['refresh_token']
-    del Dict['device_code']
-    Dict.Reset()
-    Dict.Save()
+    api_cache.Clear()
+    api_channel_info.Clear()
+    thumb_cache.Clear()
+
+    token_mutex.acquire()
+    try:
+        del Dict['access_token']
+        del Dict['refresh_token']
+        del Dict['device_code']
+
+        # The quota belongs to the API project rather than the account, so
+        # what has been used today still counts after signing out
+        quota_mutex.acquire()
+        try:
+            quota = LoadQuota()
+            Dict.Reset()
+            Dict['quota'] = quota
+        finally:
+            quota_mutex.release()
+
+        Dict.Save()
+    finally:
+        token_mutex.release()
 
 
 def OAuthRequest(params, rtype='token'):
@@ -1268,11 +2536,11 @@ def OAuthRequest(params, rtype='token'):
         params['client_secret'] = YT_SECRET
 
     try:
-        res = JSON.ObjectFromURL(
+        res = JSON.ObjectFromString(api_transport.Request(
             'https://accounts.google.com/o/oauth2/' + rtype,
-            values=params,
-            cacheTime=0
-        )
+            headers={'Content-Type': 'application/x-www-form-urlencoded'},
+            data=urlencode(params)
+        ))
         if 'error' in res:
             res = False
     except:
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014, KOL
+# Copyright (c) 2019, Tim Angus
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the <organization> nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL <COPYRIGHT HOLDER> BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import hashlib
+from collections import OrderedDict
+from threading import Lock, Event
+from time import time
+
+# Seconds between saves of a cache index when only last used times changed
+INDEX_SAVE_INTERVAL = 60
+
+
+class SingleFlight:
+    """
+    Lets concurrent callers asking for the same key share a single call of
+    the function that produces it, instead of each making their own.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = Lock()
+
+    def Do(self, key, func):
+        self.lock.acquire()
+        try:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = {'done': Event(), 'result': None}
+                self.calls[key] = call
+        finally:
+            self.lock.release()
+
+        if not leader:
+            call['done'].wait()
+            return call['result']
+
+        try:
+            call['result'] = func()
+        finally:
+            self.lock.acquire()
+            try:
+                del self.calls[key]
+            finally:
+                self.lock.release()
+            call['done'].set()
+
+        return call['result']
+
+
+class LRUCache:
+    def __init__(self, size):
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = Lock()
+
+    def Get(self, key):
+        self.lock.acquire()
+        try:
+            if key not in self.items:
+                return None
+            # Move to the most recently used end
+            value = self.items.pop(key)
+            self.items[key] = value
+            return value
+        finally:
+            self.lock.release()
+
+    def Set(self, key, value):
+        self.lock.acquire()
+        try:
+            if key in self.items:
+                del self.items[key]
+            self.items[key] = value
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+        finally:
+            self.lock.release()
+
+    def Keys(self):
+        self.lock.acquire()
+        try:
+            return self.items.keys()
+        finally:
+            self.lock.release()
+
+    def Delete(self, key):
+        self.lock.acquire()
+        try:
+            if key in self.items:
+                del self.items[key]
+        finally:
+            self.lock.release()
+
+    def Clear(self):
+        self.lock.acquire()
+        try:
+            self.items.clear()
+        finally:
+            self.lock.release()
+
+
+class ResponseCache:
+    """
+    Two tier cache; a small in-memory LRU in front of a larger one in the
+    Data store, which survives restarts. Entries are never expired here so
+    that the caller can still revalidate them once they are stale.
+    """
+
+    def __init__(self, name, memory_size=200, disk_size=2000):
+        self.name = name
+        self.memory = LRUCache(memory_size)
+        self.disk_size = disk_size
+        self.lock = Lock()
+        self.index = None
+        self.index_saved = 0
+
+    def ItemName(self, key):
+        return '%s_%s' % (self.name, hashlib.md5(repr(key)).hexdigest())
+
+    def LoadIndex(self):
+        # Data item name: [key, last used]; callers hold self.lock
+        if self.index is None:
+            name = self.name + '_index'
+            self.index = dict(Dict[name]) if name in Dict else {}
+        return self.index
+
+    def SaveIndex(self, force=False):
+        # Last used times change on every read, so unless entries were added
+        # or removed they are only written out every so often
+        if not force and time() - self.index_saved < INDEX_SAVE_INTERVAL:
+            return
+
+        # Reassign rather than modify in place, so Dict knows to save it
+        Dict[self.name + '_index'] = dict(self.index)
+        self.index_saved = time()
+
+    def Get(self, key):
+        entry = self.memory.Get(key)
+        if entry is not None:
+            return entry
+
+        name = self.ItemName(key)
+
+        self.lock.acquire()
+        try:
+            found = name in self.LoadIndex()
+        finally:
+            self.lock.release()
+
+        if not found:
+            return None
+
+        try:
+            entry = Data.LoadObject(name)
+        except:
+            entry = None
+
+        self.lock.acquire()
+        try:
+            index = self.LoadIndex()
+            if name in index:
+                if entry is None:
+                    del index[name]
+                else:
+                    index[name][1] = time()
+                self.SaveIndex()
+        finally:
+            self.lock.release()
+
+        if entry is not None:
+            self.memory.Set(key, entry)
+
+        return entry
+
+    def Set(self, key, entry):
+        self.memory.Set(key, entry)
+        name = self.ItemName(key)
+
+        # Writing the entry can be slow, so do it before taking the lock
+        Data.SaveObject(name, entry)
+
+        self.lock.acquire()
+        try:
+            index = self.LoadIndex()
+            added = name not in index
+            index[name] = [key, time()]
+
+            while len(index) > self.disk_size:
+                oldest = min(index, key=lambda item: index[item][1])
+                self.RemoveItem(oldest)
+                del index[oldest]
+
+            self.SaveIndex(force=added)
+        finally:
+            self.lock.release()
+
+    def Invalidate(self, match):
+        for key in self.memory.Keys():
+            if match(key):
+                self.memory.Delete(key)
+
+        self.lock.acquire()
+        try:
+            index = self.LoadIndex()
+            for name, (key, used) in index.items():
+                if match(key):
+                    self.RemoveItem(name)
+                    del index[name]
+            self.SaveIndex(force=True)
+        finally:
+            self.lock.release()
+
+    def Clear(self):
+        self.memory.Clear()
+
+        self.lock.acquire()
+        try:
+            for name in self.LoadIndex():
+                self.RemoveItem(name)
+            self.index = {}
+            self.SaveIndex(force=True)
+        finally:
+            self.lock.release()
+
+    def RemoveItem(self, name):
+        try:
+            Data.Remove(name)
+        except:
+            pass
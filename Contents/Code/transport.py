@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014, KOL
+# Copyright (c) 2019, Tim Angus
+# All rights reserved.
+
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the <organization> nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL <COPYRIGHT HOLDER> BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import httplib
+import random
+import select
+import socket
+import zlib
+from urlparse import urlparse
+from threading import Lock
+from time import time
+
+USER_AGENT = 'YouTubeTV Plex Plugin'
+
+# Servers drop idle keep-alive connections, so don't rely on ones older
+# than this
+IDLE_TIMEOUT = 60
+
+
+class TransportError(Exception):
+    def __init__(self, code, content, headers):
+        Exception.__init__(self, 'HTTP Error %d' % code)
+        self.code = code
+        self.content = content
+        self.headers = headers
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class Response:
+    def __init__(self, status, headers, content):
+        self.status = status
+        self.headers = headers
+        self.content = content
+
+
+class Transport:
+    """
+    Minimal HTTP client that keeps connections alive between requests, one
+    pool of idle connections per host, and transparently decodes gzip
+    responses. HTTP.Request opens a new connection, and does a new TLS
+    handshake, for every single request.
+    """
+
+    def __init__(self, pool_size=8, timeout=30):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.pools = {}
+        self.lock = Lock()
+
+    def Request(self, url, data=None, headers={}, method=None, timeout=None):
+        return self.Fetch(url, data, headers, method, timeout).content
+
+    def Fetch(self, url, data=None, headers={}, method=None, timeout=None):
+        url = urlparse(url)
+        path = url.path + ('?' + url.query if url.query else '')
+        key = (url.scheme, url.netloc)
+
+        if method is None:
+            method = 'GET' if data is None else 'POST'
+
+        headers = dict(headers)
+        headers['Accept-Encoding'] = 'gzip'
+        headers['User-Agent'] = USER_AGENT
+
+        if timeout is None:
+            timeout = self.timeout
+
+        while True:
+            conn, reused = self.Acquire(key, timeout)
+            try:
+                conn.request(method, path, data, headers)
+                res = conn.getresponse()
+                content = res.read()
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                # The server may have dropped an idle connection, in which
+                # case a GET is safe to retry on a new one
+                if reused and method == 'GET':
+                    continue
+                raise
+            break
+
+        if res.will_close:
+            conn.close()
+        else:
+            self.Release(key, conn)
+
+        if res.getheader('content-encoding', '').lower() == 'gzip':
+            content = zlib.decompress(content, 16 + zlib.MAX_WBITS)
+
+        if res.status >= 400:
+            raise TransportError(res.status, content, dict(res.getheaders()))
+
+        return Response(res.status, dict(res.getheaders()), content)
+
+    def Acquire(self, key, timeout):
+        while True:
+            conn = None
+            self.lock.acquire()
+            try:
+                if key in self.pools and self.pools[key]:
+                    conn, released = self.pools[key].pop()
+            finally:
+                self.lock.release()
+
+            if conn is None:
+                break
+
+            if time() - released > IDLE_TIMEOUT or IsDropped(conn):
+                conn.close()
+                continue
+
+            conn.timeout = timeout
+            conn.sock.settimeout(timeout)
+            return (conn, True)
+
+        scheme, host = key
+        if scheme == 'https':
+            conn = httplib.HTTPSConnection(host, timeout=timeout)
+        else:
+            conn = httplib.HTTPConnection(host, timeout=timeout)
+
+        return (conn, False)
+
+    def Release(self, key, conn):
+        self.lock.acquire()
+        try:
+            pool = self.pools.setdefault(key, [])
+            if len(pool) < self.pool_size and conn.sock is not None:
+                pool.append((conn, time()))
+                conn = None
+        finally:
+            self.lock.release()
+
+        # Beyond the pool size connections are not worth keeping around
+        if conn is not None:
+            conn.close()
+
+
+def IsDropped(conn):
+    # An idle connection has nothing to read, unless the server has closed
+    # it; the same check urllib3 does
+    try:
+        readable, writable, errored = select.select([conn.sock], [], [], 0)
+        return bool(readable)
+    except (select.error, socket.error, ValueError):
+        return True
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter, so that clients which failed
+    together don't all retry together.
+    """
+
+    def __init__(self, attempts=3, base=1.0, cap=30.0):
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+
+    def Delay(self, attempt, retry_after=None):
+        # None means give up
+        if attempt + 1 >= self.attempts:
+            return None
+
+        if retry_after is not None:
+            # Not worth waiting for longer than we would ever back off
+            return retry_after if retry_after <= self.cap else None
+
+        return random.uniform(0, min(self.cap, self.base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    After threshold consecutive failures, refuses requests for cooldown
+    seconds and then lets a single trial request through; if that fails
+    too, it waits again.
+    """
+
+    def __init__(self, threshold=5, cooldown=30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened = None
+        self.trial = False
+        self.lock = Lock()
+
+    def Allow(self):
+        self.lock.acquire()
+        try:
+            if self.opened is None:
+                return True
+
+            if not self.trial and time() - self.opened >= self.cooldown:
+                self.trial = True
+                return True
+
+            return False
+        finally:
+            self.lock.release()
+
+    def Success(self):
+        self.lock.acquire()
+        try:
+            self.failures = 0
+            self.opened = None
+            self.trial = False
+        finally:
+            self.lock.release()
+
+    def Abandon(self):
+        # The outcome of an admitted request isn't known, so let another
+        # trial through rather than waiting for this one forever
+        self.lock.acquire()
+        try:
+            self.trial = False
+        finally:
+            self.lock.release()
+
+    def Failure(self):
+        self.lock.acquire()
+        try:
+            self.failures += 1
+            if self.trial or self.failures >= self.threshold:
+                self.opened = time()
+                self.trial = False
+        finally:
+            self.lock.release()
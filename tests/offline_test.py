@@ -0,0 +1,724 @@
+# -*- coding: utf-8 -*-
+
+# Checks and micro-benchmarks for the parts of the plugin that don't need
+# Plex Media Server or the network. Run with Python 2.7 from anywhere:
+#
+#     python2 tests/offline_test.py          run the checks
+#     python2 tests/offline_test.py bench    run them and print timings
+#
+# The framework globals the code uses are replaced by small stand-ins below.
+
+import BaseHTTPServer
+import SocketServer
+import gzip
+import httplib
+import imp
+import json
+import os
+import pickle
+import re
+import sys
+import unittest
+import zlib
+from StringIO import StringIO
+from threading import Thread
+from time import time, sleep
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+CONTENTS = os.path.join(ROOT, 'Contents')
+
+sys.path.insert(0, os.path.join(CONTENTS, 'Code'))
+
+from transport import CircuitBreaker, Transport
+
+
+###############################################################################
+# Framework stand-ins
+###############################################################################
+
+class RegexStub:
+    MULTILINE = re.MULTILINE
+
+    def __call__(self, pattern, flags=0):
+        return re.compile(pattern, flags)
+
+
+class LogStub:
+    def Debug(self, msg):
+        pass
+
+    Info = Error = Debug
+
+
+class ElementStub:
+    def __init__(self, html):
+        self.html = html
+
+    def xpath(self, path):
+        return []
+
+    def text_content(self):
+        return re.sub(r'<[^>]*>', '', re.sub(r'<br\s*/?>', '\n', self.html))
+
+
+class HTMLStub:
+    def ElementFromString(self, html):
+        return ElementStub(html)
+
+    def ElementFromURL(self, url):
+        raise AssertionError('Tried to download %s' % url)
+
+
+class HTTPStub:
+    def Request(self, url, *args, **kwargs):
+        raise AssertionError('Tried to download %s' % url)
+
+
+def LoadService(name, path):
+    # Service code is executed by the framework rather than imported, with
+    # its globals already in place
+    module = imp.new_module(name)
+    module.__dict__.update({
+        'Regex': RegexStub(),
+        'Log': LogStub(),
+        'HTML': HTMLStub(),
+        'HTTP': HTTPStub(),
+        'indirect': lambda func: func,
+    })
+    sys.modules[name] = module
+
+    source = open(path).read()
+    exec compile(source, path, 'exec') in module.__dict__
+    return module
+
+
+SHARED = os.path.join(CONTENTS, 'Services', 'Shared Code')
+jsinterp = LoadService('jsinterp', os.path.join(SHARED, 'jsinterp.pys'))
+Video = LoadService('video', os.path.join(SHARED, 'video.pys'))
+Service = LoadService('service', os.path.join(
+    CONTENTS, 'Services', 'URL', 'YouTubeTV', 'ServiceCode.pys'
+))
+
+
+###############################################################################
+# Fixtures
+###############################################################################
+
+VID = 'dQw4w9WgXcQ'
+
+# URL: what ClassifyURL should make of it
+URL_CORPUS = [
+    ('https://www.youtube.com/watch?v=%s' % VID, ('video', VID)),
+    ('http://youtube.com/watch?feature=share&v=%s' % VID, ('video', VID)),
+    ('HTTPS://WWW.YOUTUBE.COM/watch?v=%s' % VID, ('video', VID)),
+    ('https://m.youtube.com/watch?v=%s&t=42' % VID, ('video', VID)),
+    ('https://music.youtube.com/watch?v=%s&list=RDAMVM' % VID, ('video', VID)),
+    ('https://youtu.be/%s' % VID, ('video', VID)),
+    ('https://youtu.be/%s?t=10' % VID, ('video', VID)),
+    ('https://www.youtube.com/shorts/%s' % VID, ('video', VID)),
+    ('https://www.youtube.com/live/%s?si=abc' % VID, ('video', VID)),
+    ('https://www.youtube.com/embed/%s?autoplay=1' % VID, ('video', VID)),
+    ('https://www.youtube.com/v/%s' % VID, ('video', VID)),
+    ('https://www.youtube.com/e/%s' % VID, ('video', VID)),
+    ('https://youtube.googleapis.com/v/%s' % VID, ('video', VID)),
+    ('https://www.youtube.com/my_subscriptions?pid=%s' % VID, ('video', VID)),
+    ('https://www.youtube.com/user/name#p/a/u/0/%s' % VID, ('video', VID)),
+    ('https://www.youtube.com/playlist?list=PLx0sYbCqOb8TBPRdmBHs5Iftvv9TPboYG',
+        ('playlist', 'PLx0sYbCqOb8TBPRdmBHs5Iftvv9TPboYG')),
+    ('https://www.youtube.com/channel/UC38IQsAvIsxxjztdMZQtwHA',
+        ('channel', 'UC38IQsAvIsxxjztdMZQtwHA')),
+    ('https://www.youtube.com/user/someone', ('user', 'someone')),
+    ('https://www.youtube.com/embed/videoseries?list=PL123',
+        ('playlist', 'PL123')),
+    ('https://www.youtube.com/embed/videoseries', (None, None)),
+    ('https://www.youtube.com/movie/the-last-man-on-earth', (None, None)),
+    ('https://www.youtube.com/@handle', (None, None)),
+    ('https://www.youtube.com/watch?v=short', (None, None)),
+    ('https://www.youtube.com/', (None, None)),
+    ('https://example.com/watch?v=%s' % VID, (None, None)),
+    ('https://notyoutube.com/embed/%s' % VID, (None, None)),
+]
+
+
+WATCH_PAGE_HEAD = (
+    '<html><head><meta itemprop="datePublished" content="2019-01-02">'
+    '</head><body><script>var ytplayer = ytplayer || {};'
+    'ytplayer.config = {"args": {"title": "A \\"quoted\\" {title}", '
+    '"video_id": "%s"}, "assets": {"js": "/s/player.js"}};</script>'
+    '<div id="watch-description-text" class="">First line<br />'
+    'Second line</div>' % VID
+)
+
+# Everything after what the scanner needs, which it shouldn't read
+WATCH_PAGE = WATCH_PAGE_HEAD + '<div>%s</div></body></html>' % ('x' * 500000)
+
+
+def ScanWatchPage(page, chunk_size):
+    # What ReadWatchPage does with the response, returning the scanner
+    # and how much of the page it read
+    scanner = Video.WatchPageScanner()
+    read = 0
+    while not scanner.IsDone() and read < len(page):
+        scanner.Feed(page[read:read + chunk_size])
+        read += chunk_size
+
+    return scanner, min(read, len(page))
+
+
+SIGNATURE = (
+    'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789.'
+    'ABCDEFGHIJKLMNOPQRSTUVWX'
+)
+
+# The usual shape of the player's signature function
+PLAYER_JS = (
+    'var Xy={ab:function(a){a.reverse()},cd:function(a,b){a.splice(0,b)},'
+    'ef:function(a,b){var c=a[0];a[0]=a[b%a.length];a[b%a.length]=c}};'
+    'c&&d.set(b,sigf(c));'
+    'sigf=function(a){a=a.split("");Xy.ef(a,45);Xy.cd(a,2);Xy["ab"](a,12);'
+    'Xy.ef(a,7);return a.join("")};'
+)
+
+# The swap written out inline, which spans several statements
+PLAYER_JS_INLINE = (
+    'c&&d.set(b,sigf(c));'
+    'sigf=function(a){a=a.split("");var c=a[0];a[0]=a[5%a.length];'
+    'a[5%a.length]=c;a.reverse();a=a.slice(3);return a.join("")};'
+)
+
+# A statement that isn't one of the known operations, so the function has
+# to be interpreted
+PLAYER_JS_UNREADABLE = PLAYER_JS.replace(
+    'Xy.cd(a,2);',
+    'var q=2;a=a.slice(q);'
+)
+
+
+def Interpret(js, sig):
+    return jsinterp.JSInterpreter(js).extract_function('sigf')([sig])
+
+
+API_RESPONSE = '{"kind": "youtube#videoListResponse", "items": [%s]}' % \
+    ', '.join(['{"id": "%s", "etag": "abcdef"}' % VID] * 20)
+
+
+class APIHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # Keeps connections alive like the API does, gzipping if asked to
+    protocol_version = 'HTTP/1.1'
+    connections = 0
+
+    # Headers are written one at a time, which Nagle's algorithm would
+    # hold up on a reused connection
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        APIHandler.connections += 1
+
+    def do_GET(self):
+        body = API_RESPONSE
+        gzipped = 'gzip' in self.headers.get('accept-encoding', '')
+        if gzipped:
+            buf = StringIO()
+            f = gzip.GzipFile(fileobj=buf, mode='wb')
+            f.write(body)
+            f.close()
+            body = buf.getvalue()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('content-length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write('ok')
+
+        # Servers drop idle connections without saying so beforehand
+        self.close_connection = 1
+
+    def log_message(self, *args):
+        pass
+
+
+class APIServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def StartAPIServer():
+    server = APIServer(('127.0.0.1', 0), APIHandler)
+    thread = Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, 'http://127.0.0.1:%d/videos' % server.server_port
+
+
+# Projections sent by the call sites, as they appear in Code/__init__.py;
+# ApiGetParams adds etag to each
+FEED_SEARCH_FIELDS = 'nextPageToken,items(id/videoId,snippet/publishedAt)'
+FEED_UPLOADS_FIELDS = \
+    'nextPageToken,items(contentDetails(videoId,videoPublishedAt))'
+VIDEO_FIELDS = (
+    'nextPageToken,items(id,snippet(title,description,localized,channelId,'
+    'channelTitle,publishedAt,thumbnails/high,liveBroadcastContent),'
+    'contentDetails/duration)'
+)
+
+
+def Thumbnails():
+    return dict(
+        (name, {
+            'url': 'https://i.ytimg.com/vi/%s/%s.jpg' % (VID, name),
+            'width': width,
+            'height': height,
+        }) for name, width, height in (
+            ('default', 120, 90),
+            ('medium', 320, 180),
+            ('high', 480, 360),
+            ('standard', 640, 480),
+            ('maxres', 1280, 720),
+        )
+    )
+
+
+def SearchSnippet():
+    # Search results only carry the start of the description, and fewer
+    # thumbnails
+    return {
+        'publishedAt': '2019-01-02T03:04:05.000Z',
+        'channelId': 'UC38IQsAvIsxxjztdMZQtwHA',
+        'title': 'A video title of a typical length',
+        'description': 'Lorem ipsum dolor sit amet, consectetur adipiscing. '
+            * 3,
+        'thumbnails': dict(
+            (name, thumb) for name, thumb in Thumbnails().items()
+            if name in ('default', 'medium', 'high')
+        ),
+        'channelTitle': 'A channel',
+        'liveBroadcastContent': 'none',
+        'publishTime': '2019-01-02T03:04:05.000Z',
+    }
+
+
+def Snippet():
+    description = 'Lorem ipsum dolor sit amet, consectetur adipiscing. ' * 30
+    return {
+        'publishedAt': '2019-01-02T03:04:05.000Z',
+        'channelId': 'UC38IQsAvIsxxjztdMZQtwHA',
+        'title': 'A video title of a typical length',
+        'description': description,
+        'thumbnails': Thumbnails(),
+        'channelTitle': 'A channel',
+        'tags': ['tag %d' % i for i in range(15)],
+        'categoryId': '10',
+        'liveBroadcastContent': 'none',
+        'defaultAudioLanguage': 'en',
+        'localized': {
+            'title': 'A video title of a typical length',
+            'description': description,
+        },
+    }
+
+
+# Full responses to 50 item pages, as they'd be without fields=
+FULL_RESPONSES = {
+    'feed search': ({
+        'kind': 'youtube#searchListResponse',
+        'etag': 'abcdefghijklmnopqrstuvwxyz0',
+        'nextPageToken': 'CDIQAA',
+        'regionCode': 'GB',
+        'pageInfo': {'totalResults': 500, 'resultsPerPage': 50},
+        'items': [{
+            'kind': 'youtube#searchResult',
+            'etag': 'abcdefghijklmnopqrstuvwxyz%d' % i,
+            'id': {'kind': 'youtube#video', 'videoId': VID},
+            'snippet': SearchSnippet(),
+        } for i in range(50)],
+    }, FEED_SEARCH_FIELDS),
+    'feed uploads': ({
+        'kind': 'youtube#playlistItemListResponse',
+        'etag': 'abcdefghijklmnopqrstuvwxyz0',
+        'nextPageToken': 'CDIQAA',
+        'pageInfo': {'totalResults': 500, 'resultsPerPage': 50},
+        'items': [{
+            'kind': 'youtube#playlistItem',
+            'etag': 'abcdefghijklmnopqrstuvwxyz%d' % i,
+            'id': 'UExHUHRfM2dQVjNkWUZ3%d' % i,
+            'snippet': dict(Snippet(), position=i, playlistId='UU38IQsAvIs'),
+            'contentDetails': {
+                'videoId': VID,
+                'videoPublishedAt': '2019-01-02T03:04:05.000Z',
+            },
+        } for i in range(50)],
+    }, FEED_UPLOADS_FIELDS),
+    'videos': ({
+        'kind': 'youtube#videoListResponse',
+        'etag': 'abcdefghijklmnopqrstuvwxyz0',
+        'pageInfo': {'totalResults': 50, 'resultsPerPage': 50},
+        'items': [{
+            'kind': 'youtube#video',
+            'etag': 'abcdefghijklmnopqrstuvwxyz%d' % i,
+            'id': VID,
+            'snippet': Snippet(),
+            'contentDetails': {
+                'duration': 'PT4M13S',
+                'dimension': '2d',
+                'definition': 'hd',
+                'caption': 'false',
+                'licensedContent': True,
+                'contentRating': {},
+                'projection': 'rectangular',
+            },
+        } for i in range(50)],
+    }, VIDEO_FIELDS),
+}
+
+
+def ParseFields(fields, pos=0):
+    # The fields= syntax as a tree of name: subtree, where None means the
+    # whole value; returns the tree and where it stopped
+    tree = {}
+    while pos < len(fields) and fields[pos] != ')':
+        path = re.match(r'\w+(?:/\w+)*', fields[pos:]).group(0)
+        pos += len(path)
+
+        sub = None
+        if pos < len(fields) and fields[pos] == '(':
+            sub, pos = ParseFields(fields, pos + 1)
+            pos += 1
+
+        names = path.split('/')
+        node = tree
+        for name in names[:-1]:
+            node = node.setdefault(name, {})
+        node[names[-1]] = sub
+
+        if pos < len(fields) and fields[pos] == ',':
+            pos += 1
+
+    return tree, pos
+
+
+def Project(data, tree):
+    # What the API returns for data when asked for the fields in tree
+    if tree is None:
+        return data
+    if isinstance(data, list):
+        return [Project(item, tree) for item in data]
+
+    return dict(
+        (name, Project(data[name], sub))
+        for name, sub in tree.items() if name in data
+    )
+
+
+def ProjectedResponse(name):
+    full, fields = FULL_RESPONSES[name]
+    return Project(full, ParseFields('etag,' + fields)[0])
+
+
+###############################################################################
+# Checks
+###############################################################################
+
+class ClassifyURLTest(unittest.TestCase):
+    def testCorpus(self):
+        for url, expected in URL_CORPUS:
+            self.assertEqual(Video.ClassifyURL(url), expected, url)
+
+    def testNormalizeWithoutNetwork(self):
+        for url, (kind, oid) in URL_CORPUS:
+            if kind == 'video':
+                self.assertEqual(
+                    Service.NormalizeURL(url),
+                    Video.GetServiceURL(oid),
+                    url
+                )
+
+
+class WatchPageScannerTest(unittest.TestCase):
+    def testWholePage(self):
+        scanner, read = ScanWatchPage(WATCH_PAGE, len(WATCH_PAGE))
+        self.assertTrue(scanner.IsDone())
+        self.assertTrue(scanner.config.startswith('{"args"'))
+        self.assertTrue(scanner.config.endswith('"/s/player.js"}}'))
+        self.assertEqual(scanner.date, '2019-01-02')
+        self.assertEqual(scanner.description, 'First line\nSecond line')
+
+    def testChunked(self):
+        whole, read = ScanWatchPage(WATCH_PAGE, len(WATCH_PAGE))
+
+        # Every split point, including inside escapes and the markers
+        for size in range(1, 64):
+            scanner, read = ScanWatchPage(WATCH_PAGE, size)
+            self.assertEqual(scanner.config, whole.config, size)
+            self.assertEqual(scanner.date, whole.date, size)
+            self.assertEqual(scanner.description, whole.description, size)
+            self.assertTrue(read < len(WATCH_PAGE_HEAD) + size, size)
+
+    def testStopsEarly(self):
+        scanner, read = ScanWatchPage(WATCH_PAGE, Video.WATCH_PAGE_CHUNK_SIZE)
+        self.assertTrue(scanner.IsDone())
+        self.assertEqual(read, Video.WATCH_PAGE_CHUNK_SIZE)
+
+
+class SignatureOpsTest(unittest.TestCase):
+    def testStaticOps(self):
+        ops = Video.ExtractSignatureOps(PLAYER_JS, SIGNATURE)
+        self.assertEqual(
+            ops,
+            [('swap', 45), ('splice', 2), ('reverse', 0), ('swap', 7)]
+        )
+        self.assertEqual(
+            Video.ApplySignatureOps(ops, SIGNATURE),
+            Interpret(PLAYER_JS, SIGNATURE)
+        )
+
+    def testInline(self):
+        ops = Video.ExtractSignatureOps(PLAYER_JS_INLINE, SIGNATURE)
+        self.assertEqual(ops, [('swap', 5), ('reverse', 0), ('slice', 3)])
+        self.assertEqual(
+            Video.ApplySignatureOps(ops, SIGNATURE),
+            Interpret(PLAYER_JS_INLINE, SIGNATURE)
+        )
+
+    def testStorable(self):
+        # Operations are kept in the Data store, which pickles them
+        for js in (PLAYER_JS, PLAYER_JS_UNREADABLE):
+            ops = Video.ExtractSignatureOps(js, SIGNATURE)
+            self.assertEqual(pickle.loads(pickle.dumps(ops)), ops)
+
+    def testMemberAssignmentIgnored(self):
+        js = 'z.Xy={ab:function(a,b){a.splice(0,b)}};' + PLAYER_JS
+        self.assertEqual(
+            Video.ExtractSignatureOps(js, SIGNATURE),
+            Video.ExtractSignatureOps(PLAYER_JS, SIGNATURE)
+        )
+
+    def testPermuteFallback(self):
+        ops = Video.ExtractSignatureOps(PLAYER_JS_UNREADABLE, SIGNATURE)
+        self.assertEqual(ops[0][0], 'permute')
+        self.assertEqual(
+            Video.ApplySignatureOps(ops, SIGNATURE),
+            Interpret(PLAYER_JS_UNREADABLE, SIGNATURE)
+        )
+
+    def testMisreadHelper(self):
+        # Looks like a reverse, but does more; the interpreter has the
+        # final say
+        js = PLAYER_JS.replace('a.reverse()', 'a.reverse();a.splice(0,1)')
+        ops = Video.ExtractSignatureOps(js, SIGNATURE)
+        self.assertEqual(ops[0][0], 'permute')
+        self.assertEqual(
+            Video.ApplySignatureOps(ops, SIGNATURE),
+            Interpret(js, SIGNATURE)
+        )
+
+
+class TransportTest(unittest.TestCase):
+    def setUp(self):
+        self.server, self.url = StartAPIServer()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def testKeepAlive(self):
+        transport = Transport()
+        APIHandler.connections = 0
+        for i in range(10):
+            self.assertEqual(transport.Request(self.url), API_RESPONSE)
+        self.assertEqual(APIHandler.connections, 1)
+
+    def testDroppedConnection(self):
+        # A POST isn't retried, so it mustn't go out on a connection the
+        # server has already closed
+        transport = Transport()
+        self.assertEqual(transport.Request(self.url, data='a=1'), 'ok')
+        sleep(0.1)
+        self.assertEqual(transport.Request(self.url, data='a=2'), 'ok')
+
+
+class FieldsTest(unittest.TestCase):
+    def testCallSites(self):
+        # The projections above have to be the ones the plugin sends
+        source = open(os.path.join(CONTENTS, 'Code', '__init__.py')).read()
+        for fields in (FEED_SEARCH_FIELDS, FEED_UPLOADS_FIELDS):
+            self.assertTrue("fields='%s'" % fields in source, fields)
+        constant = re.search(
+            r'YT_VIDEO_FIELDS = \((.*?)\n\)',
+            source,
+            re.DOTALL
+        ).group(1)
+        self.assertEqual(
+            ''.join(re.findall(r"'([^']*)'", constant)),
+            VIDEO_FIELDS
+        )
+
+    def testProjection(self):
+        res = ProjectedResponse('feed search')
+        self.assertEqual(set(res), set(['etag', 'nextPageToken', 'items']))
+        self.assertEqual(res['items'][0], {
+            'id': {'videoId': VID},
+            'snippet': {'publishedAt': '2019-01-02T03:04:05.000Z'},
+        })
+
+        item = ProjectedResponse('videos')['items'][0]
+        self.assertEqual(item['contentDetails'], {'duration': 'PT4M13S'})
+        self.assertEqual(item['snippet']['thumbnails'].keys(), ['high'])
+        self.assertTrue('tags' not in item['snippet'])
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def testOpensAndRecovers(self):
+        breaker = CircuitBreaker(threshold=2, cooldown=3600)
+
+        breaker.Failure()
+        self.assertTrue(breaker.Allow())
+        breaker.Failure()
+        self.assertFalse(breaker.Allow())
+
+        # After the cooldown only one trial is let through
+        breaker.cooldown = 0
+        self.assertTrue(breaker.Allow())
+        self.assertFalse(breaker.Allow())
+
+        breaker.Success()
+        self.assertTrue(breaker.Allow())
+        self.assertTrue(breaker.Allow())
+
+    def testFailedTrialReopens(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=0)
+        breaker.Failure()
+        self.assertTrue(breaker.Allow())
+
+        breaker.cooldown = 3600
+        breaker.Failure()
+        self.assertFalse(breaker.Allow())
+
+    def testAbandonedTrial(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=0)
+        breaker.Failure()
+        self.assertTrue(breaker.Allow())
+        self.assertFalse(breaker.Allow())
+
+        # An outcome that says nothing about the API frees up the trial
+        breaker.Abandon()
+        self.assertTrue(breaker.Allow())
+
+
+###############################################################################
+# Benchmarks
+###############################################################################
+
+def Timed(func, repeat):
+    start = time()
+    for i in xrange(repeat):
+        func()
+    return (time() - start) / repeat
+
+
+def BenchmarkURLs():
+    urls = [url for url, expected in URL_CORPUS]
+    per_pass = Timed(lambda: [Video.ClassifyURL(url) for url in urls], 2000)
+    print 'ClassifyURL: %d URLs/s' % (len(urls) / per_pass)
+
+    videos = [url for url, (kind, oid) in URL_CORPUS if kind == 'video']
+    per_pass = Timed(lambda: [Service.NormalizeURL(url) for url in videos],
+        2000)
+    print 'NormalizeURL (offline shapes): %d URLs/s' % (len(videos) / per_pass)
+
+
+def BenchmarkWatchPage():
+    scanner, read = ScanWatchPage(WATCH_PAGE, Video.WATCH_PAGE_CHUNK_SIZE)
+    print 'WatchPageScanner: read %d of %d bytes (%.1f%%)' % (
+        read,
+        len(WATCH_PAGE),
+        100.0 * read / len(WATCH_PAGE)
+    )
+    print 'WatchPageScanner: %.2fms per page' % (1000 * Timed(
+        lambda: ScanWatchPage(WATCH_PAGE, Video.WATCH_PAGE_CHUNK_SIZE),
+        200
+    ))
+
+
+def BenchmarkSignature():
+    interpreted = jsinterp.JSInterpreter(PLAYER_JS).extract_function('sigf')
+    compiled = Video.ExtractSignatureOps(PLAYER_JS, SIGNATURE)
+    permute = Video.ExtractSignatureOps(PLAYER_JS_UNREADABLE, SIGNATURE)
+
+    print 'Decrypt interpreted: %.1fus' % (1000000 * Timed(
+        lambda: interpreted([SIGNATURE]), 2000
+    ))
+    print 'Decrypt compiled: %.1fus' % (1000000 * Timed(
+        lambda: Video.ApplySignatureOps(compiled, SIGNATURE), 2000
+    ))
+    print 'Decrypt permutation: %.1fus' % (1000000 * Timed(
+        lambda: Video.ApplySignatureOps(permute, SIGNATURE), 2000
+    ))
+
+
+def BenchmarkTransport():
+    # Plex's HTTP.Request opens a new connection for every request; over
+    # the loopback there is no TLS handshake, so the real saving is larger
+    server, url = StartAPIServer()
+    host = url.split('/')[2]
+
+    def NewConnection():
+        conn = httplib.HTTPConnection(host)
+        conn.request('GET', '/videos', headers={'Accept-Encoding': 'gzip'})
+        zlib.decompress(conn.getresponse().read(), 16 + zlib.MAX_WBITS)
+        conn.close()
+
+    transport = Transport()
+    print 'New connection per call: %d calls/s' % (1 / Timed(NewConnection, 500))
+    print 'Transport: %d calls/s' % (1 / Timed(
+        lambda: transport.Request(url), 500
+    ))
+
+    server.shutdown()
+    server.server_close()
+
+
+def BenchmarkFields():
+    for name in sorted(FULL_RESPONSES):
+        full = json.dumps(FULL_RESPONSES[name][0])
+        projected = json.dumps(ProjectedResponse(name))
+        print '%s: %d bytes, %.2fms to decode; with fields= %d bytes, ' \
+            '%.2fms' % (
+                name,
+                len(full),
+                1000 * Timed(lambda: json.loads(full), 200),
+                len(projected),
+                1000 * Timed(lambda: json.loads(projected), 200)
+            )
+
+
+# Run in this order by "bench"
+BENCHMARKS = [
+    BenchmarkURLs,
+    BenchmarkTransport,
+    BenchmarkFields,
+    BenchmarkWatchPage,
+    BenchmarkSignature,
+]
+
+
+if __name__ == '__main__':
+    bench = 'bench' in sys.argv[1:]
+    if bench:
+        sys.argv.remove('bench')
+
+    result = unittest.main(exit=False).result
+    if bench and result.wasSuccessful():
+        for benchmark in BENCHMARKS:
+            print
+            benchmark()
+
+    sys.exit(0 if result.wasSuccessful() else 1)